@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Submit a long-running request to the agent as an async job and follow it to the end
+Uses POST /agent/run with "async": true, then polls GET /agent/jobs/{id}.
+
+Run this to submit a job:  python agent_jobs.py "check system performance" --planner
+Run this to check the job API against an in-process server:  python agent_jobs.py --check
+"""
+
+import argparse
+import sys
+import threading
+import time
+
+import requests
+
+
+def submit(target, input_text, planner=False):
+    body = {"input": input_text, "async": True}
+    if planner:
+        body["planner"] = "llm"
+    return requests.post(f"{target}/agent/run", json=body, timeout=10)
+
+
+def follow(target, status_url, interval=0.2, timeout=120):
+    """Poll a job until it finishes; returns its final view"""
+    deadline = time.monotonic() + timeout
+    while True:
+        job = requests.get(target + status_url, timeout=10).json()
+        if job.get("status") not in ("queued", "running") or time.monotonic() > deadline:
+            return job
+        time.sleep(interval)
+
+
+def check_jobs():
+    """Submit, poll, cancel, fill the table and let jobs expire on an in-process server"""
+    import minimal_server
+    from stub_ollama_server import start_stub
+
+    # One worker and room for three jobs; planner requests wait on a slow stub model
+    stub = start_stub(delay=0.3)
+    minimal_server.react_agent.configure_llm_backends([(stub.url, "llama3.1")])
+    minimal_server.admission_controller = minimal_server.AdmissionController(bucket_capacity=10**9, refill_rate=10**9)
+    minimal_server.job_manager = minimal_server.JobManager(minimal_server.react_agent, max_workers=1,
+                                                           max_jobs=3, retention=1.0)
+    server = minimal_server.ThreadedAgentServer(("127.0.0.1", 0), minimal_server.SmartitectureHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    target = f"http://127.0.0.1:{server.server_address[1]}"
+
+    print("🧪 Async job API")
+    print("=" * 40)
+    ok = True
+
+    def report(label, passed):
+        nonlocal ok
+        ok = ok and passed
+        print(f"• {label} {'✅' if passed else '❌'}")
+
+    slow = submit(target, "hello there smartitecture", planner=True)
+    slow_url = slow.headers.get("Location")
+    report(f"submit: {slow.status_code} with Location {slow_url}",
+           slow.status_code == 202 and slow_url == f"/agent/jobs/{slow.json()['job_id']}")
+
+    # The single worker is busy, so the next job waits in the queue and can be cancelled there
+    queued = submit(target, "2 + 2").json()
+    cancelled = requests.delete(f"{target}{queued['status_url']}?reason=check", timeout=10)
+    report(f"cancel while queued: {cancelled.status_code} {cancelled.json().get('status')}",
+           cancelled.status_code == 202 and cancelled.json().get("status") == "cancelled")
+
+    # Two more fill the table (the cancelled job makes room); the one after that is refused
+    waiting = [submit(target, "2 + 2").json() for _ in range(2)]
+    refused = submit(target, "2 + 2")
+    retry_after = refused.headers.get("Retry-After", "")
+    report(f"full table: {refused.status_code} with Retry-After {retry_after}",
+           refused.status_code == 503 and retry_after.isdigit() and int(retry_after) >= 1)
+
+    finished = follow(target, slow_url)
+    report(f"poll: {finished['status']} after {finished['progress']['steps']} step(s)",
+           finished["status"] == "succeeded" and "Text analysis" in finished["result"]["result"]
+           and finished["progress"]["steps"] >= 1)
+    report("queued jobs ran after it", all(follow(target, job["status_url"])["status"] == "succeeded"
+                                           for job in waiting))
+
+    # Finished jobs are dropped once their retention is up
+    time.sleep(1.2)
+    expired = requests.get(target + slow_url, timeout=10)
+    remaining = requests.get(f"{target}/agent/jobs", timeout=10).json()["jobs"]
+    report(f"after retention: {expired.status_code}, {len(remaining)} job(s) listed",
+           expired.status_code == 404 and remaining == [])
+
+    server.shutdown()
+    stub.shutdown()
+    print("✅ Job API check passed" if ok else "❌ Job API check failed")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run an agent request as an async job")
+    parser.add_argument("input", nargs="?", help="request for the agent")
+    parser.add_argument("--target", default="http://127.0.0.1:8001")
+    parser.add_argument("--planner", action="store_true", help="let the local LLM plan the steps")
+    parser.add_argument("--check", action="store_true", help="run the job API check and exit")
+    args = parser.parse_args()
+
+    if args.check:
+        sys.exit(0 if check_jobs() else 1)
+    if not args.input:
+        parser.error("input is required unless --check is given")
+
+    response = submit(args.target, args.input, args.planner)
+    if response.status_code != 202:
+        print(f"❌ HTTP {response.status_code}: {response.json().get('error')}")
+        sys.exit(1)
+    job = follow(args.target, response.headers["Location"])
+    print(f"🎯 Job {job['id']} {job['status']}")
+    if job.get("result"):
+        print(job["result"]["result"])
+    elif job.get("error"):
+        print(f"Error: {job['error']}")
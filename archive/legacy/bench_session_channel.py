@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Benchmark: per-message latency of the WebSocket session channel (/agent/ws) against
+the request/response path (POST /agent/run on a new connection each time, like the
+desktop client does today). Starts its own server on a free port.
+
+Run this to benchmark:  python bench_session_channel.py --requests 500
+"""
+
+import argparse
+import base64
+import json
+import math
+import os
+import socket
+import threading
+import time
+
+import requests
+
+import minimal_server
+
+
+class WebSocketClient:
+    """Just enough of a WebSocket client for the benchmark (masked text frames)"""
+
+    def __init__(self, host, port, path="/agent/ws"):
+        self.sock = socket.create_connection((host, port))
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile('rb')
+        key = base64.b64encode(os.urandom(16)).decode()
+        self.sock.sendall((f"GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\nUpgrade: websocket\r\n"
+                           f"Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\n"
+                           f"Sec-WebSocket-Version: 13\r\n\r\n").encode())
+        status = self.reader.readline()
+        if not status.startswith(b"HTTP/1.1 101 "):
+            raise ConnectionError(f"Upgrade failed: {status!r}")
+        while self.reader.readline() not in (b"\r\n", b""):
+            pass
+
+    def send(self, payload):
+        data = json.dumps(payload).encode()
+        mask = os.urandom(4)
+        length = len(data)
+        if length < 126:
+            header = bytes([0x81, 0x80 | length])
+        elif length < 65536:
+            header = bytes([0x81, 0x80 | 126]) + length.to_bytes(2, 'big')
+        else:
+            header = bytes([0x81, 0x80 | 127]) + length.to_bytes(8, 'big')
+        masked = bytes(b ^ mask[i % 4] for i, b in enumerate(data))
+        self.sock.sendall(header + mask + masked)
+
+    def receive(self):
+        first, second = self.reader.read(2)
+        length = second & 0x7F
+        if length == 126:
+            length = int.from_bytes(self.reader.read(2), 'big')
+        elif length == 127:
+            length = int.from_bytes(self.reader.read(8), 'big')
+        return json.loads(self.reader.read(length))
+
+    def receive_until(self, kinds):
+        """Skip pushed step/state events until a message of one of the given types arrives"""
+        while True:
+            message = self.receive()
+            if message["type"] in kinds:
+                return message
+
+    def close(self):
+        self.sock.close()
+
+
+def percentiles(latencies):
+    ordered = sorted(latencies)
+    pick = lambda pct: ordered[min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))]
+    return f"p50 {pick(50):.2f}ms  p90 {pick(90):.2f}ms  p99 {pick(99):.2f}ms"
+
+
+def timed(count, func):
+    latencies = []
+    for i in range(count):
+        started = time.perf_counter()
+        func(i)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the WebSocket session channel")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--input", default="2 + 2", help="agent input to run (keep it cheap to measure transport)")
+    args = parser.parse_args()
+
+    # The benchmark is a single client hammering the server: lift the rate limits
+    minimal_server.admission_controller = minimal_server.AdmissionController(bucket_capacity=10**9, refill_rate=10**9)
+    server = minimal_server.ThreadedAgentServer(("127.0.0.1", 0), minimal_server.SmartitectureHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    url = f"http://{host}:{port}/agent/run"
+
+    print("⚡ Session Channel Benchmark")
+    print("=" * 40)
+    print(f"• {args.requests} sequential requests of '{args.input}'\n")
+
+    http_latencies = timed(args.requests, lambda i: requests.post(url, json={"input": args.input}).json())
+    print(f"• HTTP POST /agent/run (new connection): {percentiles(http_latencies)}")
+
+    with requests.Session() as session:
+        keepalive = timed(args.requests, lambda i: session.post(url, json={"input": args.input}).json())
+    print(f"• HTTP POST /agent/run (requests.Session): {percentiles(keepalive)}")
+
+    client = WebSocketClient(host, port)
+
+    def ws_run(i):
+        client.send({"type": "run", "id": f"r{i}", "input": args.input})
+        client.receive_until({"result", "rejected", "error"})
+
+    ws_latencies = timed(args.requests, ws_run)
+    print(f"• WebSocket run message:                 {percentiles(ws_latencies)}")
+
+    def ws_ping(i):
+        client.send({"type": "ping", "id": f"p{i}"})
+        client.receive_until({"pong"})
+
+    print(f"• WebSocket ping (transport only):       {percentiles(timed(args.requests, ws_ping))}")
+
+    # Multiplexed: every request in flight at once on the same connection
+    started = time.perf_counter()
+    for i in range(args.requests):
+        client.send({"type": "run", "id": f"m{i}", "input": args.input})
+    for _ in range(args.requests):
+        client.receive_until({"result", "rejected", "error"})
+    elapsed = time.perf_counter() - started
+    print(f"• WebSocket multiplexed throughput:      {args.requests / elapsed:,.0f} req/s")
+    client.close()
+
+    http_p50 = sorted(http_latencies)[len(http_latencies) // 2]
+    ws_p50 = sorted(ws_latencies)[len(ws_latencies) // 2]
+    print(f"\n🎉 Median per-message latency: {http_p50:.2f}ms → {ws_p50:.2f}ms ({http_p50 / ws_p50:.1f}x)")
+    server.shutdown()
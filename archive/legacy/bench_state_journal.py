@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the agent's durable state journal
+Measures write throughput for each fsync policy and restart (recovery) time, both
+from a log alone and from a snapshot plus log tail.
+
+Run this to benchmark:  python bench_state_journal.py --records 1000000
+Run this to check crash recovery and the fsync interval:  python bench_state_journal.py --check
+"""
+
+import argparse
+import math
+import os
+import sys
+import tempfile
+import time
+
+from minimal_server import AdvancedReActAgent, StateJournal
+
+
+def write_records(state_dir, records, fsync, snapshot_every):
+    """Append records through the agent the way memory_store does
+    
+    Returns (records/sec, journal stats, per-mutation latency in ms as (p99, max)).
+    """
+    agent = AdvancedReActAgent()
+    agent.attach_journal(StateJournal(state_dir, fsync=fsync, snapshot_every=snapshot_every))
+    if snapshot_every is None:
+        agent.journal.snapshot_source = None
+
+    latencies = []
+    started = time.perf_counter()
+    for i in range(records):
+        call_started = time.perf_counter()
+        agent._record('memory.append', f"user fact number {i}")
+        latencies.append(time.perf_counter() - call_started)
+    agent.journal.close()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, math.ceil(0.99 * len(latencies)) - 1)] * 1000
+    return records / elapsed, agent.journal.stats, (p99, latencies[-1] * 1000)
+
+
+def recover(state_dir):
+    """Restart: build a fresh agent from what is on disk; returns (seconds, items, stats)"""
+    agent = AdvancedReActAgent()
+    started = time.perf_counter()
+    stats = agent.attach_journal(StateJournal(state_dir))
+    elapsed = time.perf_counter() - started
+    agent.journal.close()
+    return elapsed, len(agent.memory), stats
+
+
+def restart(state_dir, **journal_options):
+    agent = AdvancedReActAgent()
+    agent.attach_journal(StateJournal(state_dir, **journal_options))
+    return agent
+
+
+def check_recovery():
+    """Crash in the middle of a write, restart, keep writing, and restart again"""
+    print("🧪 Journal crash recovery")
+    print("=" * 40)
+    ok = True
+    # A torn tail that still parses (only the newline was lost) and one that does not
+    for name, tear in [("missing newline", lambda data: data[:-1]), ("half a record", lambda data: data[:-10])]:
+        with tempfile.TemporaryDirectory() as state_dir:
+            agent = restart(state_dir, fsync='never')
+            for item in ("one", "two"):
+                agent._record('memory.append', item)
+            agent.journal.close()
+            log_path = agent.journal.log_path
+            log_path.write_bytes(tear(log_path.read_bytes()))
+
+            agent = restart(state_dir, fsync='never')
+            agent._record('memory.append', "three")
+            agent.journal.close()
+            survived = restart(state_dir, fsync='never').memory
+            passed = survived == ["one", "three"]
+            ok = ok and passed
+            print(f"• {name}: {survived} {'✅' if passed else '❌'}")
+
+    # Background snapshots lose nothing, and a compaction cut short is finished on restart
+    with tempfile.TemporaryDirectory() as state_dir:
+        agent = restart(state_dir, fsync='never', snapshot_every=1000)
+        for i in range(50000):
+            agent._record('memory.append', i)
+        agent.journal.close()
+        survived = restart(state_dir, fsync='never').memory
+        passed = survived == list(range(50000)) and agent.journal.stats["snapshots"] > 0
+        ok = ok and passed
+        print(f"• {agent.journal.stats['snapshots']} background snapshots: {len(survived):,} of 50,000 items "
+              f"{'✅' if passed else '❌'}")
+    with tempfile.TemporaryDirectory() as state_dir:
+        agent = restart(state_dir, fsync='never')
+        for item in ("one", "two"):
+            agent._record('memory.append', item)
+        agent.journal.close()
+        # Stop as if the process died right after rotating the log
+        journal = agent.journal
+        os.replace(journal.log_path, journal.rotated_path)
+        agent = restart(state_dir, fsync='never')
+        agent._record('memory.append', "three")
+        agent.journal.close()
+        survived = restart(state_dir, fsync='never').memory
+        passed = survived == ["one", "two", "three"] and not journal.rotated_path.exists()
+        ok = ok and passed
+        print(f"• interrupted compaction: {survived} {'✅' if passed else '❌'}")
+
+    # A short burst followed by idle time is still synced within the interval
+    with tempfile.TemporaryDirectory() as state_dir:
+        agent = restart(state_dir, fsync='interval', fsync_interval=0.2)
+        for i in range(100):
+            agent._record('memory.append', f"burst {i}")
+        time.sleep(0.5)
+        fsyncs = agent.journal.stats["fsyncs"]
+        agent.journal.close()
+        passed = fsyncs >= 1
+        ok = ok and passed
+        print(f"• burst then idle: {fsyncs} fsync(s) within the interval {'✅' if passed else '❌'}")
+
+    print("✅ Recovery check passed" if ok else "❌ Recovery check failed")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the durable state journal")
+    parser.add_argument("--records", type=int, default=1_000_000)
+    parser.add_argument("--fsync-always-records", type=int, default=2_000,
+                        help="records for the fsync=always run, which is bounded by disk flush latency")
+    parser.add_argument("--check", action="store_true", help="run the crash recovery check and exit")
+    args = parser.parse_args()
+
+    if args.check:
+        sys.exit(0 if check_recovery() else 1)
+
+    print("💾 State Journal Benchmark")
+    print("=" * 40)
+
+    print("\n✍️  Write throughput:")
+    for fsync, records in [('never', args.records), ('interval', args.records), ('always', args.fsync_always_records)]:
+        with tempfile.TemporaryDirectory() as state_dir:
+            rate, stats, (p99, worst) = write_records(state_dir, records, fsync, 10000)
+            print(f"• fsync={fsync:<8} {records:>9,} records: {rate:>10,.0f} records/s, "
+                  f"p99 {p99:.3f}ms, worst {worst:.1f}ms ({stats['snapshots']} snapshots, {stats['fsyncs']} fsyncs)")
+
+    print("\n🔄 Restart time:")
+    with tempfile.TemporaryDirectory() as state_dir:
+        write_records(state_dir, args.records, 'never', None)
+        elapsed, items, stats = recover(state_dir)
+        print(f"• log only:          {elapsed:.2f}s for {items:,} items ({stats['replayed_records']:,} records replayed)")
+    with tempfile.TemporaryDirectory() as state_dir:
+        write_records(state_dir, args.records, 'never', 10000)
+        elapsed, items, stats = recover(state_dir)
+        print(f"• snapshot + tail:   {elapsed:.2f}s for {items:,} items ({stats['replayed_records']:,} records replayed)")
+
+    print("\n🎉 Benchmark complete!")
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the agent's tool-result cache
+Fires bursts of identical tool calls at once and measures how many actually run and
+how long the burst takes, with and without single-flight coalescing.
+
+Run this to benchmark:  python bench_tool_cache.py --callers 32
+Run this to check coalescing and the cache policies:  python bench_tool_cache.py --check
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from minimal_server import AdvancedReActAgent, ToolResultCache
+
+
+def burst(cache, callers, policy, run, key="params", repeat=1):
+    """Release `callers` identical calls together, each made `repeat` times; returns (elapsed seconds, results)"""
+    barrier = threading.Barrier(callers)
+    results = [None] * callers
+
+    def call(index):
+        barrier.wait()
+        for _ in range(repeat):
+            results[index] = cache.execute("tool", key, policy, run)
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(callers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started, results
+
+
+def counting(result="ok", delay=0.0):
+    """A fake tool that counts its runs"""
+    runs = []
+
+    def run():
+        runs.append(1)
+        time.sleep(delay)
+        return result
+
+    return run, runs
+
+
+def check_cache():
+    print("🧪 Tool result cache")
+    print("=" * 40)
+    ok = True
+
+    # Identical concurrent calls share one run; repeat with instant tools so callers also
+    # arrive just as the leader finishes, the window where a second run used to slip in
+    cache = ToolResultCache()
+    run, runs = counting(delay=0.05)
+    _, results = burst(cache, 16, {'mode': 'ttl', 'ttl': 60.0}, run)
+    passed = len(runs) == 1 and results == ["ok"] * 16
+    rounds = 300
+    run, runs = counting()
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        for i in range(rounds):
+            burst(cache, 8, {'mode': 'ttl', 'ttl': 60.0}, run, key=f"round {i}", repeat=20)
+    finally:
+        sys.setswitchinterval(switch_interval)
+    passed = passed and len(runs) == rounds
+    ok = ok and passed
+    print(f"• {rounds} bursts of 8 identical calls: {len(runs)} runs {'✅' if passed else '❌'}")
+
+    # Failures are retried, not served from the cache
+    run, runs = counting(result="Tool execution error: boom")
+    for _ in range(3):
+        cache.execute("tool", "failing", {'mode': 'ttl', 'ttl': 60.0}, run)
+    passed = len(runs) == 3
+    ok = ok and passed
+    print(f"• error results: {len(runs)} runs for 3 calls {'✅' if passed else '❌'}")
+
+    # A cached directory listing is dropped as soon as the directory changes
+    agent = AdvancedReActAgent()
+    with tempfile.TemporaryDirectory() as directory:
+        listing = f"list:{directory}"
+        first = agent.execute_tool('file_operations', listing)
+        cached = agent.execute_tool('file_operations', listing)
+        hits = agent.tool_cache.stats["hits"]
+        open(os.path.join(directory, "new.txt"), 'w').close()
+        # Coarse filesystem clocks: make sure the mtime really moves
+        stat = os.stat(directory)
+        os.utime(directory, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        changed = agent.execute_tool('file_operations', listing)
+        passed = cached == first and hits == 1 and "1 files" in changed and agent.tool_cache.stats["hits"] == 1
+    ok = ok and passed
+    print(f"• directory listing after a change: {changed.split('.')[0]} {'✅' if passed else '❌'}")
+
+    print("✅ Cache check passed" if ok else "❌ Cache check failed")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the tool result cache")
+    parser.add_argument("--callers", type=int, default=32, help="identical calls released at once")
+    parser.add_argument("--tool-ms", type=float, default=50.0, help="how long the fake tool takes")
+    parser.add_argument("--check", action="store_true", help="run the cache check and exit")
+    args = parser.parse_args()
+
+    if args.check:
+        sys.exit(0 if check_cache() else 1)
+
+    print("🗃️  Tool Cache Benchmark")
+    print("=" * 40)
+    for label, policy in [("uncached", {'mode': 'none'}), ("coalesced", {'mode': 'ttl', 'ttl': 60.0})]:
+        run, runs = counting(delay=args.tool_ms / 1000)
+        elapsed, _ = burst(ToolResultCache(), args.callers, policy, run)
+        print(f"• {label:<9} {args.callers} identical calls: {len(runs)} runs in {elapsed * 1000:.0f}ms")
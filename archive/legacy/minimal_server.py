@@ -5,10 +5,16 @@ Enhanced ReAct pattern with local LLM integration and advanced automation
 """
 
 import json
+import asyncio
+import base64
+import hashlib
+import socket
+import ssl
 import http.server
 import socketserver
 from urllib.parse import urlparse, parse_qs
 import threading
+import queue
 import time
 import re
 import math
@@ -17,15 +23,21 @@ import subprocess
 import os
 import sys
 import tempfile
+import uuid
 import shutil
 import psutil
 import requests
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
 from pathlib import Path
 
 class AdvancedReActAgent:
     """Advanced ReAct Agent with Local LLM Integration and Enhanced Automation"""
     
+    # Seconds ai_analysis waits for a model answer; planner steps use the pool's longer timeout
+    ANALYSIS_TIMEOUT = 10.0
+    
     def __init__(self):
         self.tools = {
             'calculator': self.calculator_tool,
@@ -45,10 +57,41 @@ class AdvancedReActAgent:
             'ai_analysis': self.ai_analysis_tool,
             'performance_optimizer': self.performance_optimizer_tool
         }
+        # Result cache policy per tool: 'none' always executes, 'ttl' reuses a result for
+        # a few seconds, 'validate' reuses it until the validator key (e.g. a directory mtime) changes
+        self.cache_policies = {
+            'calculator': {'mode': 'none'},
+            'text_analyzer': {'mode': 'none'},
+            'random_number': {'mode': 'none'},
+            'current_time': {'mode': 'none'},
+            'memory_store': {'mode': 'none'},
+            'screen_capture': {'mode': 'none'},
+            'file_operations': {'mode': 'validate', 'ttl': 300.0, 'when': lambda p: p.startswith('list:'), 'validator': self._directory_mtime_key},
+            'window_management': {'mode': 'none'},
+            'mouse_control': {'mode': 'none'},
+            'keyboard_control': {'mode': 'none'},
+            'system_monitor': {'mode': 'ttl', 'ttl': 3.0, 'when': lambda p: any(k in p.lower() for k in ['performance', 'cpu', 'network'])},
+            'process_manager': {'mode': 'ttl', 'ttl': 5.0, 'when': lambda p: 'list' in p.lower()},
+            # The connectivity prober keeps its own per-target cache
+            'network_tools': {'mode': 'none'},
+            'workflow_automation': {'mode': 'none'},
+            'ai_analysis': {'mode': 'none'},
+            'performance_optimizer': {'mode': 'ttl', 'ttl': 5.0}
+        }
+        self.tool_cache = ToolResultCache()
         self.memory = []
         self.scratchpad = []
         self.ollama_url = "http://localhost:11434"
         self.workflows = []
+        # Local LLM backends: SMARTITECTURE_LLM_BACKENDS="http://host:port=model,..." adds more
+        self.llm_pool = LLMBackendPool.from_env(self.ollama_url)
+        self.planner = OllamaPlanner(self.llm_pool)
+        self.journal = None
+        self._state_lock = threading.RLock()
+        self.prober = ConnectivityProber()
+        self.conversations = ConversationStore()
+        # Callbacks (op, data) run after every memory/workflow change, e.g. WebSocket pushes
+        self.state_listeners = []
     
     def calculator_tool(self, expression):
         """Simple calculator tool for basic math operations"""
@@ -117,7 +160,7 @@ class AdvancedReActAgent:
             if action_data.startswith('store:'):
                 # Store information
                 info = action_data[6:].strip()  # Remove 'store:' prefix
-                self.memory.append(info.lower())
+                self._record('memory.append', info.lower())
                 return f"Stored in memory: {info.lower()}"
             elif action_data.lower() in ['recall', 'remember', 'what do i know']:
                 # Recall all stored information
@@ -284,16 +327,52 @@ $windows | ForEach-Object { Write-Output "• $($_.ProcessName) - $($_.MainWindo
         return None, None
     
     def execute_tool(self, tool_name, parameters):
-        """Execute a tool with given parameters"""
+        """Execute a tool with given parameters, going through the result cache"""
         if tool_name in self.tools:
-            try:
-                return self.tools[tool_name](parameters)
-            except Exception as e:
-                return f"Tool execution error: {str(e)}"
+            policy = self.cache_policies.get(tool_name, {'mode': 'none'})
+            return self.tool_cache.execute(tool_name, parameters, policy,
+                                           lambda: self._run_tool(tool_name, parameters))
         else:
             available_tools = ", ".join(self.tools.keys())
             return f"Unknown tool '{tool_name}'. Available tools: {available_tools}"
     
+    def configure_llm_backends(self, backends, **pool_options):
+        """Replace the LLM backend pool with (url, model) pairs"""
+        self.llm_pool = LLMBackendPool(backends, **pool_options)
+        self.planner.pool = self.llm_pool
+    
+    def attach_journal(self, journal):
+        """Restore memory and workflows from a StateJournal and log every later change to it"""
+        with self._state_lock:
+            state, stats = journal.recover()
+            self.memory = state['memory']
+            self.workflows = state['workflows']
+            journal.snapshot_source = self._durable_state
+            self.journal = journal
+        return stats
+    
+    def _durable_state(self):
+        """The part of the agent's state that survives restarts"""
+        return {'memory': self.memory, 'workflows': self.workflows}
+    
+    def _record(self, op, data):
+        """Apply a state mutation, writing it to the journal first when one is attached"""
+        with self._state_lock:
+            if self.journal:
+                self.journal.append(op, data)
+            StateJournal.apply(self._durable_state(), op, data)
+            if self.journal:
+                self.journal.maybe_compact()
+        for listener in list(self.state_listeners):
+            listener(op, data)
+    
+    def _run_tool(self, tool_name, parameters):
+        """Run a tool directly, bypassing the cache"""
+        try:
+            return self.tools[tool_name](parameters)
+        except Exception as e:
+            return f"Tool execution error: {str(e)}"
+    
     def react_step(self, thought, iteration):
         """Execute one ReAct step: Thought -> Action -> Observation"""
         step_result = {
@@ -314,91 +393,163 @@ $windows | ForEach-Object { Write-Output "• $($_.ProcessName) - $($_.MainWindo
         
         return step_result
     
-    def process_request(self, user_input, max_iterations=3):
-        """Process user request using ReAct framework"""
-        self.scratchpad = []
+    def route_request(self, user_input):
+        """Keyword router for the first step; returns (thought with Action, confident)"""
+        thought = f"I need to analyze the request '{user_input}'. Let me think about what tools I can use to help."
+        confident = True
+        
+        # Enhanced reasoning to suggest appropriate actions including Windows automation
+        if re.search(r'\bping\b|connectivity', user_input.lower()):
+            # Host names and URLs contain '-' and '/', so check before the math branch
+            hosts = [word for word in (w.strip('?!.,;:"\'()') for w in user_input.split())
+                     if ConnectivityProber.looks_like_target(word)]
+            thought += f" User wants to check network connectivity. Action: network_tools(ping:{','.join(hosts)})"
+        elif any(op in user_input.lower() for op in ['+', '-', '*', '/', 'calculate', 'math']):
+            thought += " This looks like a math problem. Action: calculator(" + user_input + ")"
+        elif 'time' in user_input.lower() or 'date' in user_input.lower():
+            thought += " User is asking about time. Action: current_time(standard)"
+        elif 'random' in user_input.lower():
+            thought += " User wants a random number. Action: random_number(1-100)"
+        elif 'remember' in user_input.lower() and ('that' in user_input.lower() or 'my' in user_input.lower()):
+            # Extract the information to store
+            store_info = user_input.lower().replace('remember that', '').replace('remember', '').strip()
+            thought += f" User wants me to remember something. Action: memory_store(store:{store_info})"
+        elif any(recall_word in user_input.lower() for recall_word in ['what\'s my', 'what is my', 'what did i tell', 'what do i', 'recall', 'what\'s', 'favorite']):
+            thought += " User is asking me to recall something from memory. Action: memory_store(recall)"
+        # Windows Automation Tools Detection
+        elif any(screen_word in user_input.lower() for screen_word in ['screenshot', 'screen', 'capture', 'take a picture', 'what\'s on screen']):
+            thought += " User wants to capture the screen. Action: screen_capture(screenshot)"
+        elif any(file_word in user_input.lower() for file_word in ['list files', 'show files', 'directory', 'folder', 'read file', 'write file', 'current directory']):
+            if 'list' in user_input.lower() or 'show' in user_input.lower() or 'directory' in user_input.lower() or 'folder' in user_input.lower():
+                if 'current' in user_input.lower():
+                    thought += " User wants to see current directory. Action: file_operations(cwd)"
+                else:
+                    thought += " User wants to list files/directories. Action: file_operations(list:)"
+            elif 'read' in user_input.lower():
+                thought += " User wants to read a file. Action: file_operations(read:filename)"
+            elif 'write' in user_input.lower():
+                thought += " User wants to write to a file. Action: file_operations(write:filename:content)"
+            else:
+                thought += " User is asking about files. Action: file_operations(cwd)"
+        elif any(window_word in user_input.lower() for window_word in ['window', 'focus', 'active window', 'running programs', 'processes', 'applications']):
+            if 'list' in user_input.lower() or 'running' in user_input.lower() or 'programs' in user_input.lower() or 'processes' in user_input.lower():
+                thought += " User wants to see running applications. Action: window_management(list)"
+            elif 'focus' in user_input.lower():
+                # Extract process name from input like "Focus on chrome" or "Focus chrome"
+                focus_words = user_input.lower().replace('focus on', '').replace('focus', '').strip()
+                process_name = focus_words if focus_words else 'unknown'
+                thought += f" User wants to focus a window. Action: window_management(focus:{process_name})"
+            elif 'active' in user_input.lower():
+                thought += " User wants to know the active window. Action: window_management(active)"
+            else:
+                thought += " User is asking about windows. Action: window_management(active)"
+        elif 'analyze' in user_input.lower() or 'text' in user_input.lower():
+            thought += f" User wants text analysis. Action: text_analyzer({user_input})"
+        else:
+            # Nothing matched: text analysis is only a guess
+            thought += f" Let me analyze this request. Action: text_analyzer({user_input})"
+            confident = False
+        return thought, confident
+    
+    def process_request(self, user_input, max_iterations=3, use_planner=False, on_step=None, cancel_event=None,
+                        session_id=None):
+        """Process user request using ReAct framework
+        
+        With use_planner the local LLM produces each Thought/Action, except when the
+        keyword router is confident about the request. on_step is called with each step
+        as it completes; setting cancel_event stops the request before its next step.
+        With a session_id the bounded context of earlier turns in that conversation is
+        added to the scratchpad.
+        """
+        # Build the scratchpad locally so concurrent requests don't interleave
+        scratchpad = []
+        planner_session = None
+        final_answer = None
+        step = None
+        last_success = None
+        cancelled = False
+        conversation = self.conversations.get(session_id) if session_id else None
         
         # Initial analysis
-        self.scratchpad.append(f"User Request: {user_input}")
-        self.scratchpad.append(f"Available Tools: {', '.join(self.tools.keys())}")
+        if conversation:
+            scratchpad.extend(conversation.render())
+        scratchpad.append(f"User Request: {user_input}")
+        scratchpad.append(f"Available Tools: {', '.join(self.tools.keys())}")
         
         # ReAct reasoning loop
         for i in range(max_iterations):
+            if cancel_event is not None and cancel_event.is_set():
+                cancelled = True
+                break
+            
             # Generate thought based on current context
+            thought = None
             if i == 0:
-                thought = f"I need to analyze the request '{user_input}'. Let me think about what tools I can use to help."
-                
-                # Enhanced reasoning to suggest appropriate actions including Windows automation
-                if any(op in user_input.lower() for op in ['+', '-', '*', '/', 'calculate', 'math']):
-                    thought += " This looks like a math problem. Action: calculator(" + user_input + ")"
-                elif 'time' in user_input.lower() or 'date' in user_input.lower():
-                    thought += " User is asking about time. Action: current_time(standard)"
-                elif 'random' in user_input.lower():
-                    thought += " User wants a random number. Action: random_number(1-100)"
-                elif 'remember' in user_input.lower() and ('that' in user_input.lower() or 'my' in user_input.lower()):
-                    # Extract the information to store
-                    store_info = user_input.lower().replace('remember that', '').replace('remember', '').strip()
-                    thought += f" User wants me to remember something. Action: memory_store(store:{store_info})"
-                elif any(recall_word in user_input.lower() for recall_word in ['what\'s my', 'what is my', 'what did i tell', 'what do i', 'recall', 'what\'s', 'favorite']):
-                    thought += " User is asking me to recall something from memory. Action: memory_store(recall)"
-                # Windows Automation Tools Detection
-                elif any(screen_word in user_input.lower() for screen_word in ['screenshot', 'screen', 'capture', 'take a picture', 'what\'s on screen']):
-                    thought += " User wants to capture the screen. Action: screen_capture(screenshot)"
-                elif any(file_word in user_input.lower() for file_word in ['list files', 'show files', 'directory', 'folder', 'read file', 'write file', 'current directory']):
-                    if 'list' in user_input.lower() or 'show' in user_input.lower() or 'directory' in user_input.lower() or 'folder' in user_input.lower():
-                        if 'current' in user_input.lower():
-                            thought += " User wants to see current directory. Action: file_operations(cwd)"
-                        else:
-                            thought += " User wants to list files/directories. Action: file_operations(list:)"
-                    elif 'read' in user_input.lower():
-                        thought += " User wants to read a file. Action: file_operations(read:filename)"
-                    elif 'write' in user_input.lower():
-                        thought += " User wants to write to a file. Action: file_operations(write:filename:content)"
-                    else:
-                        thought += " User is asking about files. Action: file_operations(cwd)"
-                elif any(window_word in user_input.lower() for window_word in ['window', 'focus', 'active window', 'running programs', 'processes', 'applications']):
-                    if 'list' in user_input.lower() or 'running' in user_input.lower() or 'programs' in user_input.lower() or 'processes' in user_input.lower():
-                        thought += " User wants to see running applications. Action: window_management(list)"
-                    elif 'focus' in user_input.lower():
-                        # Extract process name from input like "Focus on chrome" or "Focus chrome"
-                        focus_words = user_input.lower().replace('focus on', '').replace('focus', '').strip()
-                        process_name = focus_words if focus_words else 'unknown'
-                        thought += f" User wants to focus a window. Action: window_management(focus:{process_name})"
-                    elif 'active' in user_input.lower():
-                        thought += " User wants to know the active window. Action: window_management(active)"
-                    else:
-                        thought += " User is asking about windows. Action: window_management(active)"
-                elif 'analyze' in user_input.lower() or 'text' in user_input.lower():
-                    thought += f" User wants text analysis. Action: text_analyzer({user_input})"
-                else:
-                    thought += f" Let me analyze this request. Action: text_analyzer({user_input})"
-            else:
+                thought, confident = self.route_request(user_input)
+                if use_planner and not confident:
+                    planner_session = self.planner.start(self.tools, scratchpad)
+                    thought = self.planner.next_thought(planner_session) or thought
+            elif planner_session and not planner_session["error"]:
+                thought = self.planner.next_thought(planner_session, scratchpad[-1])
+                if thought is None:
+                    # The model went away mid-request: answer with what the steps so far found
+                    break
+            
+            if thought is None:
                 # Continue reasoning based on previous observations
-                last_observation = self.scratchpad[-1] if self.scratchpad else ""
+                last_observation = scratchpad[-1] if scratchpad else ""
                 thought = f"Based on the previous result: {last_observation}. I should provide a summary or additional analysis if needed."
             
+            # An unreachable model hands the request back to the keyword behaviour
+            planning = planner_session is not None and not planner_session["error"]
+            
+            # The planner ends the loop by answering instead of acting
+            if planning and self.parse_action(thought)[0] is None:
+                final_answer = self.planner.final_answer(thought)
+                if final_answer is not None:
+                    scratchpad.append(f"Thought {i+1}: {thought}")
+                    if on_step:
+                        on_step({"iteration": i + 1, "thought": thought, "action": None, "observation": None})
+                    break
+            
             # Execute ReAct step
             step = self.react_step(thought, i + 1)
             
             # Add to scratchpad
-            self.scratchpad.append(f"Thought {i+1}: {step['thought']}")
+            scratchpad.append(f"Thought {i+1}: {step['thought']}")
             if step['action']:
-                self.scratchpad.append(f"Action {i+1}: {step['action']}")
-            self.scratchpad.append(f"Observation {i+1}: {step['observation']}")
+                scratchpad.append(f"Action {i+1}: {step['action']}")
+            scratchpad.append(f"Observation {i+1}: {step['observation']}")
+            if on_step:
+                on_step(step)
+            if step['action'] and "error" not in step['observation'].lower():
+                last_success = step
             
-            # Simple stopping condition
-            if "error" not in step['observation'].lower() and step['action']:
+            # Simple stopping condition (the planner decides for itself when it is done)
+            if not planning and "error" not in step['observation'].lower() and step['action']:
                 break
         
+        self.scratchpad = scratchpad
+        
         # Generate final result
-        final_result = f"ReAct Agent processed: {user_input}\n\nFinal Answer: {step['observation']}"
+        if final_answer is not None:
+            answer = final_answer
+        elif last_success or step:
+            answer = (last_success or step)['observation']
+        else:
+            answer = "Request cancelled" if cancelled else "No answer"
+        final_result = f"ReAct Agent processed: {user_input}\n\nFinal Answer: {answer}"
+        if conversation and not cancelled:
+            conversation.add_turn(user_input, answer)
         
         return {
             "result": final_result,
-            "state": "completed",
-            "iterations": len([s for s in self.scratchpad if s.startswith("Thought")]),
-            "scratchpad": self.scratchpad,
-            "tools_used": [s for s in self.scratchpad if s.startswith("Action")]
+            "state": "cancelled" if cancelled else "completed",
+            "iterations": len([s for s in scratchpad if s.startswith("Thought")]),
+            "scratchpad": scratchpad,
+            "tools_used": [s for s in scratchpad if s.startswith("Action")],
+            "planner": self.planner.report(planner_session) if planner_session else {"mode": "keyword"},
+            "conversation": dict(conversation.stats(), session_id=session_id) if conversation else None
         }
 
     def mouse_control_tool(self, params):
@@ -526,31 +677,22 @@ Write-Output "• Process termination available with specific commands"
             return f"Process manager error: {str(e)}"
     
     def network_tools_tool(self, params):
-        """Network diagnostics and connectivity tools"""
+        """Network diagnostics: 'ping' or 'ping:host[:port],... count=N' probes DNS, TCP and HTTP concurrently"""
         try:
             if 'ping' in params.lower():
-                ps_script = """
-$ping = Test-Connection -ComputerName google.com -Count 4 -Quiet
-if ($ping) {
-    $result = Test-Connection -ComputerName google.com -Count 1
-    Write-Output "🌐 Network Connectivity: ✅ Online"
-    Write-Output "• Ping to google.com: $($result.ResponseTime)ms"
-} else {
-    Write-Output "🌐 Network Connectivity: ❌ Offline"
-}
-"""
+                count_match = re.search(r'count\s*=\s*(\d+)', params, re.IGNORECASE)
+                count = max(1, min(int(count_match.group(1)), 20)) if count_match else 4
+                spec = params.split(':', 1)[1] if params.lower().startswith('ping:') else ''
+                spec = re.sub(r'count\s*=\s*\d+', '', spec, flags=re.IGNORECASE)
+                targets = ConnectivityProber.parse_targets(spec) or [('google.com', 443)]
+                return self.prober.run(targets, count)
             elif 'speed' in params.lower():
                 return "🌐 Network speed test requires external tools - basic connectivity available"
             else:
-                ps_script = """
-Write-Output "🌐 Network Tools:"
-Write-Output "• Use 'ping' to test internet connectivity"
-Write-Output "• Use 'speed' for speed test info"
-"""
-            
-            result = subprocess.run(['powershell', '-Command', ps_script], 
-                                  capture_output=True, text=True, shell=True)
-            return result.stdout if result.returncode == 0 else f"Network tools failed: {result.stderr}"
+                return "🌐 Network Tools:\n" + \
+                       "• Use 'ping' to test internet connectivity\n" + \
+                       "• Use 'ping:host[:port],host2 count=N' to probe specific hosts\n" + \
+                       "• Use 'speed' for speed test info"
         except Exception as e:
             return f"Network tools error: {str(e)}"
     
@@ -558,13 +700,14 @@ Write-Output "• Use 'speed' for speed test info"
         """Create and execute automated workflows"""
         try:
             if 'create' in params.lower():
-                workflow_name = f"workflow_{len(self.workflows) + 1}"
-                self.workflows.append({
-                    'name': workflow_name,
-                    'steps': params.replace('create:', '').strip().split(' then '),
-                    'created': datetime.now().isoformat()
-                })
-                return f"🎯 Created workflow '{workflow_name}' with {len(self.workflows[-1]['steps'])} steps"
+                with self._state_lock:
+                    workflow = {
+                        'name': f"workflow_{len(self.workflows) + 1}",
+                        'steps': params.replace('create:', '').strip().split(' then '),
+                        'created': datetime.now().isoformat()
+                    }
+                    self._record('workflow.append', workflow)
+                return f"🎯 Created workflow '{workflow['name']}' with {len(workflow['steps'])} steps"
             elif 'list' in params.lower():
                 if not self.workflows:
                     return "🎯 No workflows created yet. Use 'create:step1 then step2' to create one"
@@ -580,11 +723,11 @@ Write-Output "• Use 'speed' for speed test info"
     def ai_analysis_tool(self, params):
         """AI-powered analysis and insights"""
         try:
-            # Check if Ollama is available
-            if self._check_ollama_connection():
-                return self._ollama_analysis(params)
+            analysis = self._ollama_analysis(params)
+            if analysis:
+                return analysis
             else:
-                # Fallback to basic analysis
+                # No backend answered: fallback to basic analysis
                 return f"🔮 Basic AI Analysis: {params}\n" + \
                        f"• Text length: {len(params)} characters\n" + \
                        f"• Word count: {len(params.split())} words\n" + \
@@ -642,30 +785,25 @@ if ($cpuUsage -lt 50 -and $memUsage -lt 70) {
                 'file_size': 0
             }
     
-    def _check_ollama_connection(self):
-        """Check if Ollama is running and accessible"""
+    def _directory_mtime_key(self, operation):
+        """Cache validator for 'list:' operations: the directory's path and mtime"""
+        path = os.path.abspath(operation[5:].strip() or os.getcwd())
         try:
-            response = requests.get(f"{self.ollama_url}/api/tags", timeout=2)
-            return response.status_code == 200
-        except:
-            return False
+            return path, os.stat(path).st_mtime_ns
+        except OSError:
+            return path, None
     
     def _ollama_analysis(self, params):
-        """Use Ollama for advanced AI analysis"""
+        """Use the fastest healthy local LLM backend for advanced AI analysis; None if none answers"""
         try:
-            payload = {
-                "model": "llama3.1",
+            # A direct answer is expected: give up quickly and fall back to basic analysis
+            result, backend = self.llm_pool.generate({
                 "prompt": f"Analyze this request and provide insights: {params}",
                 "stream": False
-            }
-            response = requests.post(f"{self.ollama_url}/api/generate", json=payload, timeout=10)
-            if response.status_code == 200:
-                result = response.json()
-                return f"🧠 Ollama AI Analysis:\n{result.get('response', 'No response')}"
-            else:
-                return "🧠 Ollama connection failed - using basic analysis"
-        except Exception as e:
-            return f"🧠 Ollama analysis error: {str(e)}"
+            }, timeout=self.ANALYSIS_TIMEOUT)
+            return f"🧠 Ollama AI Analysis ({backend['model']}):\n{result.get('response', 'No response')}"
+        except LLMBackendError:
+            return None
     
     def _extract_process_name(self, text):
         """Extract process name from user input"""
@@ -684,10 +822,1536 @@ if ($cpuUsage -lt 50 -and $memUsage -lt 70) {
         }
         return app_mappings.get(text, text)
 
+class OllamaPlanner:
+    """ReAct planner backed by a local Ollama model
+    
+    After the first step only the newest observation is sent, together with the
+    `context` Ollama returned for the previous step, so the growing transcript is
+    not re-processed on every iteration. keep_alive keeps the model loaded between steps,
+    and later steps prefer the backend that holds it. Context is only valid for the model
+    that produced it, so a step routed to a different model gets the full transcript.
+    """
+    
+    PROMPT = """You are Smartitecture, a ReAct agent running on the user's Windows PC.
+Work one step at a time. Reply with exactly one step in one of these forms:
+Thought: <reasoning> Action: <tool_name>(<parameters>)
+Thought: <reasoning> Final Answer: <answer for the user>
+
+Available tools:
+{tools}
+
+{transcript}
+"""
+    
+    def __init__(self, pool, keep_alive="10m"):
+        self.pool = pool
+        self.keep_alive = keep_alive
+    
+    def start(self, tools, scratchpad):
+        """Create a planning session for one request"""
+        tool_lines = "\n".join(f"- {name}: {func.__doc__ or 'No description'}" for name, func in tools.items())
+        transcript = "\n".join(line for line in scratchpad if not line.startswith("Available Tools"))
+        prompt = self.PROMPT.format(tools=tool_lines, transcript=transcript)
+        return {
+            "prompt": prompt,
+            "transcript": prompt,
+            "context": None,
+            "backend": None,
+            "steps": [],
+            "error": None
+        }
+    
+    def next_thought(self, session, observation=None):
+        """Ask the model for the next step; returns None when the model can't be reached"""
+        prompt = session.pop("prompt", None) or f"{observation}\nNext step?"
+        full_prompt = prompt if not session["context"] else f"{session['transcript']}\n{prompt}"
+        payload = {
+            "prompt": prompt,
+            "stream": False,
+            "keep_alive": self.keep_alive,
+            "options": {"temperature": 0, "stop": ["\nObservation"]}
+        }
+        if session["context"]:
+            payload["context"] = session["context"]
+        
+        started = time.perf_counter()
+        try:
+            result, backend = self.pool.generate(payload, prefer=session["backend"], full_prompt=full_prompt)
+        except LLMBackendError as e:
+            session["error"] = str(e)
+            return None
+        
+        reply = result.get("response", "").strip()
+        session["transcript"] = f"{full_prompt}\n{reply}"
+        session["context"] = result.get("context") or session["context"]
+        session["backend"] = backend
+        session["steps"].append({
+            "step": len(session["steps"]) + 1,
+            "backend": backend["name"],
+            "prompt_chars": len(prompt),
+            "prompt_tokens": result.get("prompt_eval_count", 0),
+            "completion_tokens": result.get("eval_count", 0),
+            "context_tokens": len(session["context"] or []),
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1)
+        })
+        return reply
+    
+    @staticmethod
+    def final_answer(thought):
+        """Extract the Final Answer from a planner step, if it gave one"""
+        match = re.search(r'Final Answer:\s*(.*)', thought, re.IGNORECASE | re.DOTALL)
+        return match.group(1).strip() if match else None
+    
+    def report(self, session):
+        """Per-step prompt/token counts for the API response"""
+        return {
+            "mode": "llm",
+            "backends": sorted({step["backend"] for step in session["steps"]}),
+            "steps": session["steps"],
+            "prompt_tokens": sum(s["prompt_tokens"] for s in session["steps"]),
+            "completion_tokens": sum(s["completion_tokens"] for s in session["steps"]),
+            "error": session["error"]
+        }
+
+class LLMBackendError(Exception):
+    """No LLM backend produced an answer"""
+
+class LLMBackendPool:
+    """Latency-aware, hedged routing across several local LLM backends (endpoint/model pairs)
+    
+    Each backend keeps an exponentially weighted moving average of its latency and a
+    window of recent samples. A call goes to the fastest healthy backend (untried ones
+    first, so every backend gets measured); if it hasn't answered by that backend's p95,
+    a hedged duplicate goes to the next-best backend and the first answer wins. A
+    backend is ranked by the older of its average and its longest call still in flight,
+    so a stall counts against it before the stalled call returns. Failing backends sit
+    out a cool-down. Backends with max_inflight calls outstanding are skipped, and when
+    all of them are that busy the call fails at once instead of piling up more.
+    """
+    
+    def __init__(self, backends, alpha=0.3, hedge_min_delay=0.05, initial_hedge_delay=2.0,
+                 min_samples=5, cooldown=15.0, connect_timeout=2.0, timeout=60.0, max_inflight=4):
+        self.backends = [{
+            "name": f"{model}@{url}",
+            "url": url.rstrip('/'),
+            "model": model,
+            "ewma_ms": None,
+            "samples": deque(maxlen=100),
+            "requests": 0,
+            "errors": 0,
+            "wins": 0,
+            "hedges": 0,
+            "inflight": {},
+            "down_until": 0.0
+        } for url, model in backends]
+        self.alpha = alpha
+        self.hedge_min_delay = hedge_min_delay
+        self.initial_hedge_delay = initial_hedge_delay
+        self.min_samples = min_samples
+        self.cooldown = cooldown
+        self.connect_timeout = connect_timeout
+        self.timeout = timeout
+        self.max_inflight = max_inflight
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "hedged": 0, "hedge_wins": 0, "failovers": 0, "failures": 0, "abandoned": 0, "busy": 0}
+    
+    @classmethod
+    def from_env(cls, default_url, default_model="llama3.1"):
+        """Backends from SMARTITECTURE_LLM_BACKENDS ("url=model,url=model"), else the default one"""
+        backends = []
+        for item in os.environ.get('SMARTITECTURE_LLM_BACKENDS', '').split(','):
+            if item.strip():
+                url, _, model = item.strip().partition('=')
+                backends.append((url, model or default_model))
+        return cls(backends or [(default_url, default_model)])
+    
+    def _p95(self, backend):
+        if len(backend["samples"]) < self.min_samples:
+            return None
+        ordered = sorted(backend["samples"])
+        return ordered[min(len(ordered) - 1, math.ceil(0.95 * len(ordered)) - 1)]
+    
+    def _expected_ms(self, backend, now):
+        """EWMA latency, raised to the age of the oldest call still in flight; the caller holds the lock"""
+        expected = backend["ewma_ms"] or 0.0
+        if backend["inflight"]:
+            expected = max(expected, (now - min(backend["inflight"].values())) * 1000)
+        return expected
+    
+    def _stalled(self, backend, now):
+        """True while one of the backend's calls has been in flight past its p95"""
+        with self._lock:
+            if not backend["inflight"]:
+                return False
+            p95 = self._p95(backend)
+            limit = max(p95 / 1000, self.hedge_min_delay) if p95 else self.initial_hedge_delay
+            return now - min(backend["inflight"].values()) > limit
+    
+    def ranked(self, prefer=None):
+        """Healthy backends fastest first (the preferred one leads); if none is healthy, the ones
+        whose cool-down ends first. Backends at max_inflight are left out either way."""
+        now = time.monotonic()
+        with self._lock:
+            available = [b for b in self.backends if len(b["inflight"]) < self.max_inflight]
+            healthy = [b for b in available if b["down_until"] <= now]
+            candidates = healthy or sorted(available, key=lambda b: b["down_until"])
+            ranked = sorted(candidates, key=lambda b: self._expected_ms(b, now))
+        if any(b is prefer for b in ranked):
+            ranked = [prefer] + [b for b in ranked if b is not prefer]
+        return ranked
+    
+    def _call(self, backend, call, payload, context_model, full_prompt, timeout):
+        request = dict(payload, model=backend["model"])
+        if "context" in request and backend["model"] != context_model:
+            # Context tokens belong to another model: send the whole conversation instead
+            del request["context"]
+            request["prompt"] = full_prompt
+        started = time.perf_counter()
+        try:
+            response = requests.post(f"{backend['url']}/api/generate", json=request,
+                                     timeout=(self.connect_timeout, timeout))
+            response.raise_for_status()
+            result = response.json()
+        except Exception:
+            with self._lock:
+                del backend["inflight"][call]
+                backend["requests"] += 1
+                backend["errors"] += 1
+                backend["down_until"] = time.monotonic() + self.cooldown
+            raise
+        
+        # Losing hedges still report their latency, which keeps slow backends ranked low
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            del backend["inflight"][call]
+            backend["requests"] += 1
+            backend["samples"].append(elapsed_ms)
+            backend["ewma_ms"] = elapsed_ms if backend["ewma_ms"] is None else \
+                self.alpha * elapsed_ms + (1 - self.alpha) * backend["ewma_ms"]
+            backend["down_until"] = 0.0
+        return result
+    
+    def _submit(self, backend, payload, context_model, full_prompt, timeout):
+        """Start a call on its own thread (an abandoned hedge must not hold up later calls);
+        None when the backend already has max_inflight calls outstanding"""
+        call = object()
+        with self._lock:
+            if len(backend["inflight"]) >= self.max_inflight:
+                return None
+            backend["inflight"][call] = time.monotonic()
+        future = Future()
+        
+        def run():
+            try:
+                future.set_result(self._call(backend, call, payload, context_model, full_prompt, timeout))
+            except Exception as e:
+                future.set_exception(e)
+        
+        threading.Thread(target=run, daemon=True).start()
+        return future
+    
+    def generate(self, payload, prefer=None, full_prompt=None, timeout=None):
+        """POST /api/generate to the best backend, hedging and failing over; returns (result, backend)
+        
+        timeout (seconds to wait for an answer) defaults to the pool's; interactive callers
+        pass a shorter one.
+        """
+        context_model = prefer["model"] if prefer else None
+        full_prompt = full_prompt or payload.get("prompt", "")
+        timeout = timeout or self.timeout
+        candidates = self.ranked(prefer)
+        with self._lock:
+            self.stats["calls"] += 1
+        
+        pending = {}
+        
+        def launch_next():
+            """Start a call on the best remaining candidate with room for it; returns that backend"""
+            while candidates:
+                backend = candidates.pop(0)
+                future = self._submit(backend, payload, context_model, full_prompt, timeout)
+                if future is not None:
+                    pending[future] = backend
+                    return backend
+            return None
+        
+        primary = launch_next()
+        if primary is None:
+            with self._lock:
+                self.stats["failures"] += 1
+                self.stats["busy"] += 1
+            raise LLMBackendError(f"Every LLM backend has {self.max_inflight} calls in flight")
+        p95 = self._p95(primary)
+        hedge_delay = max(p95 / 1000, self.hedge_min_delay) if p95 else self.initial_hedge_delay
+        deadline = time.monotonic() + timeout
+        hedged = None
+        last_error = None
+        
+        while pending:
+            wait_for = deadline - time.monotonic()
+            if candidates and not hedged:
+                wait_for = min(wait_for, hedge_delay)
+            done, _ = wait(pending, timeout=max(wait_for, 0), return_when=FIRST_COMPLETED)
+            
+            if not done:
+                if time.monotonic() >= deadline:
+                    break
+                # Primary is slower than its p95: race a duplicate on the next-best backend,
+                # unless that one is stuck as well
+                now = time.monotonic()
+                if self._stalled(candidates[0], now):
+                    hedge_delay = deadline - now
+                    continue
+                hedged = launch_next()
+                if hedged:
+                    with self._lock:
+                        self.stats["hedged"] += 1
+                        primary["hedges"] += 1
+                continue
+            
+            for future in done:
+                backend = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+                with self._lock:
+                    backend["wins"] += 1
+                    if backend is hedged:
+                        self.stats["hedge_wins"] += 1
+                    # Losers run on until they time out; their latency still counts against them
+                    self.stats["abandoned"] += len(pending)
+                return result, backend
+            
+            # Everything in flight failed: fail over to the next backend
+            if not pending and launch_next():
+                with self._lock:
+                    self.stats["failovers"] += 1
+        
+        with self._lock:
+            self.stats["failures"] += 1
+        raise LLMBackendError(f"No LLM backend answered: {last_error or 'timed out'}")
+    
+    def snapshot(self):
+        """Per-backend routing stats"""
+        now = time.monotonic()
+        with self._lock:
+            backends = [{
+                "name": b["name"],
+                "url": b["url"],
+                "model": b["model"],
+                "healthy": b["down_until"] <= now,
+                "ewma_ms": round(b["ewma_ms"], 2) if b["ewma_ms"] is not None else None,
+                "p95_ms": round(self._p95(b), 2) if self._p95(b) is not None else None,
+                "requests": b["requests"],
+                "errors": b["errors"],
+                "wins": b["wins"],
+                "hedges_triggered": b["hedges"],
+                "in_flight": len(b["inflight"])
+            } for b in self.backends]
+            return {**self.stats, "backends": backends}
+
+class StateJournal:
+    """Append-only write-ahead log of agent state mutations, compacted into snapshots
+    
+    Every record is flushed to the OS so it survives a process crash; the fsync policy
+    decides how much can be lost to a power failure: nothing with 'always', at most
+    fsync_interval seconds of writes with 'interval' (a timer syncs whatever is still
+    pending), and whatever the OS had not written back with 'never'.
+    Recovery loads the snapshot and replays only the log records written after it.
+    
+    Compaction copies the state and rotates the log while mutations are paused, then
+    writes the snapshot on a background thread; the rotated log is kept until the
+    snapshot covering it is safely on disk.
+    """
+    
+    FSYNC_POLICIES = ('always', 'interval', 'never')
+    
+    def __init__(self, state_dir, fsync='interval', fsync_interval=1.0, snapshot_every=10000):
+        if fsync not in self.FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {', '.join(self.FSYNC_POLICIES)}")
+        self.state_dir = Path(state_dir)
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        self.log_path = self.state_dir / 'agent_state.log'
+        self.rotated_path = self.state_dir / 'agent_state.log.1'
+        self.snapshot_path = self.state_dir / 'agent_state.snapshot.json'
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.snapshot_every = snapshot_every
+        self.snapshot_source = None
+        self._lock = threading.Lock()
+        self._log = None
+        self._seq = 0
+        self._since_snapshot = 0
+        self._snapshot_size = 0
+        self._last_sync = time.monotonic()
+        self._dirty = False
+        self._sync_timer = None
+        self._compaction = None
+        self.stats = {"appended": 0, "snapshots": 0, "fsyncs": 0}
+    
+    @staticmethod
+    def apply(state, op, data):
+        """Apply one logged mutation to a state dict"""
+        if op == 'memory.append':
+            state['memory'].append(data)
+        elif op == 'workflow.append':
+            state['workflows'].append(data)
+        else:
+            raise ValueError(f"Unknown state operation '{op}'")
+    
+    def recover(self):
+        """Load the snapshot, replay the log tail and open the log for appending"""
+        started = time.perf_counter()
+        state = {'memory': [], 'workflows': []}
+        snapshot_seq = 0
+        if self.snapshot_path.exists():
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+            state = snapshot['state']
+            snapshot_seq = self._seq = snapshot['seq']
+        
+        # A rotated log means the process stopped while a snapshot was being written:
+        # its records come before those in the current log
+        replayed = 0
+        for path in (self.rotated_path, self.log_path):
+            if path.exists():
+                replayed += self._replay(path, state, snapshot_seq)
+        
+        if self.rotated_path.exists():
+            # Fold the interrupted compaction into a fresh snapshot before serving anything
+            self._write_snapshot(state, self._seq)
+            self.log_path.write_bytes(b"")
+            self.rotated_path.unlink()
+            self._since_snapshot = 0
+        else:
+            self._since_snapshot = replayed
+        
+        self._snapshot_size = len(state['memory']) + len(state['workflows'])
+        self._log = open(self.log_path, 'a', encoding='utf-8')
+        return state, {
+            "snapshot_seq": snapshot_seq,
+            "replayed_records": replayed,
+            "recovery_ms": round((time.perf_counter() - started) * 1000, 1)
+        }
+    
+    def _replay(self, path, state, snapshot_seq):
+        """Apply a log file's records newer than the snapshot; returns how many were applied"""
+        replayed = 0
+        valid_bytes = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                # A line without its newline is a torn final write from a crash, even
+                # if it happens to parse: drop it and everything after it
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                valid_bytes += len(line)
+                if record['seq'] <= snapshot_seq:
+                    continue
+                self.apply(state, record['op'], record['data'])
+                self._seq = record['seq']
+                replayed += 1
+        if valid_bytes < path.stat().st_size:
+            with open(path, 'r+b') as f:
+                f.truncate(valid_bytes)
+        return replayed
+    
+    def append(self, op, data):
+        """Durably log one mutation before it is applied"""
+        with self._lock:
+            self._seq += 1
+            self._log.write(json.dumps({"seq": self._seq, "op": op, "data": data}) + "\n")
+            self._log.flush()
+            self._sync(force=self.fsync == 'always')
+            self.stats["appended"] += 1
+            self._since_snapshot += 1
+    
+    def maybe_compact(self):
+        """Snapshot once the log has grown enough; call after the logged mutation is applied"""
+        with self._lock:
+            # Compact once the log reaches a quarter of the last snapshot, so rewriting the
+            # whole state stays amortised O(1) per record as the state grows
+            if (self.snapshot_source and self._since_snapshot >= max(self.snapshot_every, self._snapshot_size // 4)
+                    and not (self._compaction and self._compaction.is_alive())):
+                self._start_compaction()
+    
+    def _sync(self, force=False):
+        """fsync per the policy; the caller holds the lock"""
+        if self.fsync == 'never':
+            return
+        now = time.monotonic()
+        if force or now - self._last_sync >= self.fsync_interval:
+            os.fsync(self._log.fileno())
+            self._last_sync = now
+            self._dirty = False
+            self.stats["fsyncs"] += 1
+            return
+        # Too soon to sync again: make sure the pending writes are synced when the interval is up
+        self._dirty = True
+        if self._sync_timer is None:
+            self._sync_timer = threading.Timer(self.fsync_interval - (now - self._last_sync), self._sync_pending)
+            self._sync_timer.daemon = True
+            self._sync_timer.start()
+    
+    def _sync_pending(self):
+        with self._lock:
+            self._sync_timer = None
+            if self._dirty and self._log:
+                self._sync(force=True)
+    
+    def _start_compaction(self):
+        """Copy the state, rotate the log and write the snapshot in the background; the caller holds the lock
+        
+        snapshot_source is called under the agent's state lock too (maybe_compact runs inside
+        _record), so the copy and the rotation point agree on the same seq.
+        """
+        state = {key: list(items) for key, items in self.snapshot_source().items()}
+        seq = self._seq
+        if self._dirty:
+            self._sync(force=True)
+        self._log.close()
+        os.replace(self.log_path, self.rotated_path)
+        self._log = open(self.log_path, 'a', encoding='utf-8')
+        self._since_snapshot = 0
+        self._snapshot_size = len(state['memory']) + len(state['workflows'])
+        self._compaction = threading.Thread(target=self._finish_compaction, args=(state, seq), daemon=True)
+        self._compaction.start()
+    
+    def _finish_compaction(self, state, seq):
+        self._write_snapshot(state, seq)
+        # Everything in the rotated log is now covered by the snapshot
+        self.rotated_path.unlink(missing_ok=True)
+        with self._lock:
+            self.stats["snapshots"] += 1
+    
+    def _write_snapshot(self, state, seq):
+        temp_path = self.snapshot_path.with_suffix('.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({"seq": seq, "state": state}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.snapshot_path)
+    
+    def compact(self):
+        """Force a snapshot now and wait for it"""
+        self._wait_for_compaction()
+        with self._lock:
+            if self.snapshot_source:
+                self._start_compaction()
+        self._wait_for_compaction()
+    
+    def _wait_for_compaction(self):
+        compaction = self._compaction
+        if compaction:
+            compaction.join()
+    
+    def close(self):
+        self._wait_for_compaction()
+        with self._lock:
+            if self._sync_timer:
+                self._sync_timer.cancel()
+                self._sync_timer = None
+            if self._log:
+                self._log.flush()
+                if self.fsync != 'never':
+                    os.fsync(self._log.fileno())
+                    self.stats["fsyncs"] += 1
+                self._log.close()
+                self._log = None
+    
+    def snapshot(self):
+        """Journal counters for the health endpoint"""
+        with self._lock:
+            return {**self.stats, "seq": self._seq, "fsync": self.fsync, "log_records": self._since_snapshot}
+
+class ConnectivityProber:
+    """Concurrent connectivity prober built on asyncio
+    
+    Every target gets N rounds of DNS resolution, TCP connect and (for web ports) an
+    HTTP HEAD; all targets are probed at once. Recent per-target results are reused
+    for a few seconds.
+    """
+    
+    HTTP_PORTS = {80, 8000, 8001, 8080, 11434}
+    HTTPS_PORTS = {443, 8443}
+    # host.name, IPv4 address or localhost, each with an optional :port
+    HOST_PATTERN = re.compile(
+        r'^(?:(?:[a-z0-9](?:[a-z0-9-]*[a-z0-9])?\.)+[a-z]{2,}|(?:\d{1,3}\.){3}\d{1,3}|localhost)(?::\d{1,5})?$',
+        re.IGNORECASE)
+    
+    def __init__(self, timeout=3.0, max_concurrency=32, cache_ttl=15.0):
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.cache_ttl = cache_ttl
+        self._cache = {}
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def parse_targets(spec, default_port=443):
+        """Parse 'host', 'host:port' and URLs separated by commas or spaces into (host, port)"""
+        targets = []
+        for item in re.split(r'[,\s]+', spec.strip()):
+            if not item:
+                continue
+            parsed = urlparse(item if '://' in item else f"//{item}")
+            if not parsed.hostname:
+                continue
+            port = parsed.port or (80 if parsed.scheme == 'http' else default_port)
+            targets.append((parsed.hostname, port))
+        return targets
+    
+    @classmethod
+    def looks_like_target(cls, word):
+        """True for words shaped like a host, host:port or URL (not just any word with a dot)"""
+        if '://' in word:
+            return bool(urlparse(word).hostname)
+        return bool(cls.HOST_PATTERN.match(word))
+    
+    def run(self, targets, count=4):
+        """Probe targets (using recent cached results where possible) and format a report"""
+        now = time.monotonic()
+        results = {}
+        with self._lock:
+            for target in targets:
+                cached = self._cache.get((target, count))
+                if cached and cached[0] > now:
+                    results[target] = dict(cached[1], cached=True)
+        
+        missing = [t for t in targets if t not in results]
+        if missing:
+            fresh = asyncio.run(self.probe(missing, count))
+            expires = time.monotonic() + self.cache_ttl
+            with self._lock:
+                for target, result in fresh.items():
+                    self._cache[(target, count)] = (expires, result)
+                    results[target] = result
+                # Forget expired results so the cache stays bounded by recent targets
+                self._cache = {k: v for k, v in self._cache.items() if v[0] > now}
+        
+        return self.format_report([(t, results[t]) for t in targets], count)
+    
+    async def probe(self, targets, count=4):
+        """Run count probe rounds against every target concurrently"""
+        limit = asyncio.Semaphore(self.max_concurrency)
+        results = await asyncio.gather(*(self._probe_target(host, port, count, limit) for host, port in targets))
+        return dict(zip(targets, results))
+    
+    async def _probe_target(self, host, port, count, limit):
+        samples = {"dns": [], "tcp": [], "http": []}
+        failures = []
+        http_status = None
+        for _ in range(count):
+            async with limit:
+                try:
+                    address = await self._timed(samples["dns"], self._resolve(host, port))
+                    await self._timed(samples["tcp"], self._connect(address, port))
+                    if port in self.HTTP_PORTS or port in self.HTTPS_PORTS:
+                        http_status = await self._timed(samples["http"], self._head(host, address, port))
+                except Exception as e:
+                    failures.append(self._describe_failure(e))
+        return {
+            "ok": count - len(failures),
+            "failed": len(failures),
+            "reason": failures[-1] if failures else None,
+            "http_status": http_status,
+            "latency_ms": {phase: self.percentiles(values) for phase, values in samples.items() if values}
+        }
+    
+    async def _timed(self, samples, awaitable):
+        started = time.perf_counter()
+        result = await asyncio.wait_for(awaitable, self.timeout)
+        samples.append((time.perf_counter() - started) * 1000)
+        return result
+    
+    async def _resolve(self, host, port):
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        return infos[0][4][0]
+    
+    async def _connect(self, address, port):
+        reader, writer = await asyncio.open_connection(address, port)
+        writer.close()
+        await writer.wait_closed()
+    
+    async def _head(self, host, address, port):
+        """HEAD / on a fresh connection; returns the status code"""
+        tls = ssl.create_default_context() if port in self.HTTPS_PORTS else None
+        reader, writer = await asyncio.open_connection(address, port, ssl=tls, server_hostname=host if tls else None)
+        try:
+            writer.write(f"HEAD / HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n".encode())
+            await writer.drain()
+            status_line = await reader.readline()
+        finally:
+            writer.close()
+        parts = status_line.split()
+        return int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else None
+    
+    @staticmethod
+    def _describe_failure(exc):
+        if isinstance(exc, asyncio.TimeoutError):
+            return "timed out"
+        if isinstance(exc, socket.gaierror):
+            return "DNS lookup failed"
+        if isinstance(exc, ConnectionRefusedError):
+            return "connection refused"
+        return "unreachable"
+    
+    @staticmethod
+    def percentiles(values):
+        """Nearest-rank p50/p90/p99 in milliseconds"""
+        ordered = sorted(values)
+        pick = lambda pct: ordered[min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))]
+        return {"p50": round(pick(50), 2), "p90": round(pick(90), 2), "p99": round(pick(99), 2)}
+    
+    @staticmethod
+    def format_report(results, count):
+        online = any(result["ok"] for _, result in results)
+        lines = [f"🌐 Network Connectivity: {'✅ Online' if online else '❌ Offline'} ({count} probes per target)"]
+        for (host, port), result in results:
+            status = "✅" if result["ok"] == count else "⚠️" if result["ok"] else "❌"
+            line = f"• {host}:{port} {status} {result['ok']}/{count} ok"
+            for phase, stats in result["latency_ms"].items():
+                label = f"http {result['http_status']}" if phase == "http" else phase
+                line += f" | {label} p50 {stats['p50']}ms p90 {stats['p90']}ms p99 {stats['p99']}ms"
+            if result["failed"]:
+                line += f" | {result['reason']}"
+            if result.get("cached"):
+                line += " (cached)"
+            lines.append(line)
+        return "\n".join(lines)
+
+class ConversationContext:
+    """Bounded context for one conversation: recent turns verbatim, older ones summarized
+    
+    When a turn leaves the verbatim window it is folded into a running summary, so each
+    turn costs the same however long the conversation gets. The summary gives up its
+    oldest entries first to keep the rendered context within max_chars (or max_tokens,
+    estimated at four characters per token).
+    """
+    
+    CHARS_PER_TOKEN = 4
+    
+    def __init__(self, max_turns=4, max_chars=2000, max_tokens=None, turn_chars=300):
+        self.max_turns = max_turns
+        self.max_chars = max_tokens * self.CHARS_PER_TOKEN if max_tokens else max_chars
+        self.turn_chars = turn_chars
+        self.turns = deque()
+        self.summary = deque()
+        self.turn_count = 0
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _clip(text, limit):
+        text = ' '.join(str(text).split())
+        return text if len(text) <= limit else text[:limit - 3] + '...'
+    
+    def add_turn(self, user_input, answer):
+        with self._lock:
+            self.turn_count += 1
+            self.turns.append((self.turn_count, self._clip(user_input, self.turn_chars), self._clip(answer, self.turn_chars)))
+            while len(self.turns) > self.max_turns:
+                self._fold(self.turns.popleft())
+            # Trim the summary first; verbatim turns only go once it is empty
+            while self._size() > self.max_chars and (self.summary or len(self.turns) > 1):
+                if self.summary:
+                    self.summary.popleft()
+                else:
+                    self._fold(self.turns.popleft())
+    
+    def _fold(self, turn):
+        """Summarize one turn as a short entry; only the evicted turn is processed"""
+        number, user_input, answer = turn
+        self.summary.append(f"#{number} '{self._clip(user_input, 60)}' -> {self._clip(answer, 80)}")
+    
+    def _lines(self):
+        lines = []
+        if self.summary:
+            lines.append("Conversation Summary: " + "; ".join(self.summary))
+        lines.extend(f"Previous Turn {n}: User: {user_input} | Agent: {answer}" for n, user_input, answer in self.turns)
+        return lines
+    
+    def _size(self):
+        return sum(len(line) for line in self._lines())
+    
+    def render(self):
+        """Scratchpad lines for the next turn"""
+        with self._lock:
+            return self._lines()
+    
+    def stats(self):
+        with self._lock:
+            return {
+                "turns": self.turn_count,
+                "verbatim_turns": len(self.turns),
+                "summarized_turns": len(self.summary),
+                "context_chars": self._size(),
+                "max_chars": self.max_chars
+            }
+
+class ConversationStore:
+    """Per-session conversation contexts, evicting the least recently used sessions"""
+    
+    def __init__(self, max_sessions=256, **context_options):
+        self.max_sessions = max_sessions
+        self.context_options = context_options
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, session_id):
+        with self._lock:
+            context = self._sessions.get(session_id)
+            if context is None:
+                context = self._sessions[session_id] = ConversationContext(**self.context_options)
+                if len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(session_id)
+            return context
+
+class ToolResultCache:
+    """Tool result cache with per-tool freshness policies and single-flight request coalescing"""
+    
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "uncached": 0}
+    
+    def execute(self, tool_name, parameters, policy, run):
+        """Return a fresh cached result for the call, join an identical in-flight call, or run it"""
+        mode = policy.get('mode', 'none')
+        if mode == 'none' or not policy.get('when', lambda p: True)(parameters):
+            with self._lock:
+                self.stats["uncached"] += 1
+            return run()
+        
+        key = (tool_name, parameters)
+        # Validate against the state before running so a change mid-call is never masked
+        validator = policy['validator'](parameters) if mode == 'validate' else None
+        
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and time.monotonic() < entry['expires'] and entry['validator'] == validator:
+                self.stats["hits"] += 1
+                return entry['result']
+            
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = {'done': threading.Event(), 'result': None}
+                self.stats["misses"] += 1
+            else:
+                self.stats["coalesced"] += 1
+        
+        if not leader:
+            flight['done'].wait()
+            return flight['result']
+        
+        result = None
+        try:
+            result = run()
+            flight['result'] = result
+        finally:
+            # Publish the result and retire the in-flight entry together, so a caller
+            # arriving in between finds one or the other and never starts a second run
+            with self._lock:
+                # Errors are retried on the next call instead of being served from the cache
+                if result is not None and 'error' not in result.lower() and 'failed' not in result.lower():
+                    self._store(key, result, validator, policy.get('ttl', 5.0))
+                del self._inflight[key]
+            flight['done'].set()
+        return result
+    
+    def _store(self, key, result, validator, ttl):
+        """Add a cache entry; the caller holds the lock"""
+        now = time.monotonic()
+        if key not in self._entries and len(self._entries) >= self.max_entries:
+            self._entries = {k: e for k, e in self._entries.items() if e['expires'] > now}
+            if len(self._entries) >= self.max_entries:
+                # Still full: drop the oldest entry
+                del self._entries[next(iter(self._entries))]
+        self._entries[key] = {'result': result, 'validator': validator, 'expires': now + ttl}
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def snapshot(self):
+        """Hit/miss counters for the health endpoint"""
+        with self._lock:
+            return {**self.stats, "entries": len(self._entries)}
+
+class TokenBucket:
+    """Token bucket used for per-client rate limiting"""
+    
+    def __init__(self, capacity, refill_rate):
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.tokens = capacity
+        self.updated = time.monotonic()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_rate)
+        self.updated = now
+    
+    def try_consume(self, cost):
+        """Take cost tokens if available; returns (allowed, seconds until they would be)"""
+        self._refill()
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return True, 0.0
+        return False, (cost - self.tokens) / self.refill_rate
+    
+    def refund(self, cost):
+        """Give back tokens charged for work that never ran"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + cost)
+
+class AdmissionController:
+    """Admission control for /agent/run: per-client token buckets and a bounded global queue"""
+    
+    # Tools that spawn PowerShell or call out to the LLM cost more tokens than in-process ones
+    EXPENSIVE_TOOLS = {
+        'screen_capture', 'window_management', 'mouse_control', 'keyboard_control',
+        'system_monitor', 'process_manager', 'network_tools', 'ai_analysis',
+        'performance_optimizer'
+    }
+    
+    def __init__(self, max_concurrent=4, max_queue=16, queue_timeout=10.0,
+                 bucket_capacity=20, refill_rate=2.0, expensive_cost=5, cheap_cost=1,
+                 max_clients=1024):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.bucket_capacity = bucket_capacity
+        self.refill_rate = refill_rate
+        self.expensive_cost = expensive_cost
+        self.cheap_cost = cheap_cost
+        self.max_clients = max_clients
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        # Least recently seen client first, capped at max_clients
+        self._buckets = OrderedDict()
+        self._pending = 0
+        self.stats = {"admitted": 0, "throttled": 0, "shed": 0, "queue_timeouts": 0}
+    
+    def tool_cost(self, tool_name):
+        """Token cost of running a tool"""
+        return self.expensive_cost if tool_name in self.EXPENSIVE_TOOLS else self.cheap_cost
+    
+    def check_rate(self, client_id, tool_name):
+        """Charge the client's bucket; returns 0 when allowed, else seconds to wait"""
+        cost = min(self.tool_cost(tool_name), self.bucket_capacity)
+        with self._lock:
+            bucket = self._buckets.get(client_id)
+            if bucket is None:
+                if len(self._buckets) >= self.max_clients:
+                    # Forget the least recently seen client; idle ones have refilled anyway
+                    self._buckets.popitem(last=False)
+                bucket = self._buckets[client_id] = TokenBucket(self.bucket_capacity, self.refill_rate)
+            else:
+                self._buckets.move_to_end(client_id)
+            allowed, retry_after = bucket.try_consume(cost)
+            if not allowed:
+                self.stats["throttled"] += 1
+        return 0.0 if allowed else retry_after
+    
+    def refund(self, client_id, tool_name):
+        """Undo check_rate() for a request that was shed after being charged"""
+        cost = min(self.tool_cost(tool_name), self.bucket_capacity)
+        with self._lock:
+            bucket = self._buckets.get(client_id)
+            if bucket is not None:
+                bucket.refund(cost)
+    
+    def acquire(self):
+        """Join the global queue and wait for a worker slot; False means the request was shed"""
+        with self._lock:
+            if self._pending >= self.max_concurrent + self.max_queue:
+                self.stats["shed"] += 1
+                return False
+            self._pending += 1
+        
+        if self._slots.acquire(timeout=self.queue_timeout):
+            with self._lock:
+                self.stats["admitted"] += 1
+            return True
+        
+        with self._lock:
+            self._pending -= 1
+            self.stats["shed"] += 1
+            self.stats["queue_timeouts"] += 1
+        return False
+    
+    def release(self):
+        """Give back the worker slot taken by acquire()"""
+        self._slots.release()
+        with self._lock:
+            self._pending -= 1
+    
+    def retry_after(self):
+        """Rough number of seconds until the queue drains enough to admit a new request"""
+        with self._lock:
+            return 1 + self._pending // self.max_concurrent
+    
+    def snapshot(self):
+        """Counters and queue depth for the health endpoint"""
+        with self._lock:
+            return {
+                **self.stats,
+                "in_system": self._pending,
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "tracked_clients": len(self._buckets)
+            }
+
+class _CountingWriter:
+    """Wraps a handler's wfile to count the bytes written for one response"""
+    
+    def __init__(self, wfile):
+        self._wfile = wfile
+        self.bytes_written = 0
+    
+    def write(self, data):
+        self.bytes_written += len(data)
+        return self._wfile.write(data)
+    
+    def __getattr__(self, name):
+        return getattr(self._wfile, name)
+
+class TrafficRecorder:
+    """Opt-in capture of API traffic to rotating JSONL files for replay (see replay_traffic.py)
+    
+    Each sampled request is written as one line with its arrival time, path, redacted
+    body, status, response size and server-side duration.
+    """
+    
+    REDACT_FIELDS = {'password', 'token', 'api_key', 'apikey', 'secret', 'authorization'}
+    REDACT_PATTERNS = [
+        re.compile(r'[\w.+-]+@[\w-]+\.[\w.-]+'),           # e-mail addresses
+        re.compile(r'\b(?:sk|pk|ghp|xox[bp])[-_][A-Za-z0-9_-]{12,}\b'),  # API keys
+        re.compile(r'\b\d(?:[ -]?\d){11,18}\b')             # card / account numbers
+    ]
+    
+    def __init__(self, path, sample_rate=1.0, max_bytes=10 * 1024 * 1024, backup_count=5, redact_fields=None):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.redact_fields = {f.lower() for f in (redact_fields or self.REDACT_FIELDS)}
+        self._lock = threading.Lock()
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self.stats = {"captured": 0, "sampled_out": 0, "rotations": 0}
+    
+    def should_capture(self):
+        if random.random() < self.sample_rate:
+            return True
+        with self._lock:
+            self.stats["sampled_out"] += 1
+        return False
+    
+    def redact(self, value):
+        """Mask sensitive fields and anything that looks like personal data"""
+        if isinstance(value, dict):
+            return {k: '[REDACTED]' if k.lower() in self.redact_fields else self.redact(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self.redact(v) for v in value]
+        if isinstance(value, str):
+            for pattern in self.REDACT_PATTERNS:
+                value = pattern.sub('[REDACTED]', value)
+        return value
+    
+    def record(self, started_at, method, path, client_id, body, status, response_bytes, duration_ms):
+        if body:
+            try:
+                body = json.loads(body.decode())
+            except ValueError:
+                body = body.decode(errors='replace')
+        entry = {
+            "ts": round(started_at, 6),
+            "method": method,
+            "path": path,
+            "client_id": client_id,
+            "body": self.redact(body) if body else None,
+            "status": status,
+            "response_bytes": response_bytes,
+            "duration_ms": round(duration_ms, 3)
+        }
+        line = json.dumps(entry) + "\n"
+        with self._lock:
+            if self._file.tell() + len(line) > self.max_bytes:
+                self._rotate()
+            self._file.write(line)
+            self._file.flush()
+            self.stats["captured"] += 1
+    
+    def _rotate(self):
+        """capture.jsonl -> capture.jsonl.1 -> ... -> capture.jsonl.N (oldest dropped)"""
+        self._file.close()
+        for i in range(self.backup_count - 1, 0, -1):
+            older = Path(f"{self.path}.{i}")
+            if older.exists():
+                os.replace(older, f"{self.path}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        self._file = open(self.path, 'w', encoding='utf-8')
+        self.stats["rotations"] += 1
+    
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+class JobManager:
+    """Runs /agent/run requests submitted with "async": true on a background executor
+    
+    Jobs are kept in a bounded table: finished jobs are dropped after `retention`
+    seconds, or earlier (oldest first) when the table needs room. Queued and running
+    jobs are never dropped; when the table is full of them new jobs are refused.
+    """
+    
+    FINISHED = ('succeeded', 'failed', 'cancelled')
+    # Retry-After for a full table before any job has finished to learn run times from
+    DEFAULT_RETRY_AFTER = 5.0
+    
+    def __init__(self, agent, max_workers=2, max_jobs=200, retention=600.0):
+        self.agent = agent
+        self.max_jobs = max_jobs
+        self.retention = retention
+        self._run_seconds = None
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"submitted": 0, "succeeded": 0, "failed": 0, "cancelled": 0, "refused": 0}
+    
+    def submit(self, input_text, max_iterations=3, use_planner=False, session_id=None):
+        """Queue a job; returns its public view, or None when the job table is full"""
+        with self._lock:
+            self._evict(make_room=True)
+            if len(self._jobs) >= self.max_jobs:
+                self.stats["refused"] += 1
+                return None
+            job = {
+                "id": uuid.uuid4().hex,
+                "status": "queued",
+                "input": input_text,
+                "progress": {"steps": 0, "max_iterations": max_iterations, "last_action": None},
+                "created": time.time(),
+                "started": None,
+                "finished": None,
+                "result": None,
+                "error": None,
+                "_cancel": threading.Event()
+            }
+            self._jobs[job["id"]] = job
+            self.stats["submitted"] += 1
+            job["_future"] = self._executor.submit(self._run, job, max_iterations, use_planner, session_id)
+            return self._view(job)
+    
+    def _evict(self, make_room=False):
+        """Drop expired finished jobs, and with make_room the oldest finished ones while the table is full"""
+        now = time.time()
+        finished = [job for job in self._jobs.values() if job["status"] in self.FINISHED]
+        for job in finished:
+            if now - job["finished"] > self.retention or (make_room and len(self._jobs) >= self.max_jobs):
+                del self._jobs[job["id"]]
+    
+    def _run(self, job, max_iterations, use_planner, session_id):
+        with self._lock:
+            if job["_cancel"].is_set():
+                self._finish(job, "cancelled")
+                return
+            job["status"] = "running"
+            job["started"] = time.time()
+        
+        def on_step(step):
+            with self._lock:
+                job["progress"]["steps"] = step["iteration"]
+                job["progress"]["last_action"] = step["action"]
+        
+        try:
+            agent_response = self.agent.process_request(job["input"], max_iterations, use_planner,
+                                                        on_step=on_step, cancel_event=job["_cancel"],
+                                                        session_id=session_id)
+            with self._lock:
+                job["result"] = run_response_payload(agent_response, self.agent)
+                self._finish(job, "cancelled" if agent_response["state"] == "cancelled" else "succeeded")
+        except Exception as e:
+            with self._lock:
+                job["error"] = str(e)
+                self._finish(job, "failed")
+    
+    def _finish(self, job, status):
+        job["status"] = status
+        job["finished"] = time.time()
+        self.stats[status] += 1
+        if job["started"]:
+            # Moving average of run time, for estimating when a slot frees up
+            duration = job["finished"] - job["started"]
+            self._run_seconds = duration if self._run_seconds is None else 0.8 * self._run_seconds + 0.2 * duration
+    
+    def retry_after(self):
+        """Rough seconds until a full table has room: when the longest-running job should finish
+        
+        A full table holds only queued and running jobs, and the next one to finish can be
+        evicted to make room.
+        """
+        with self._lock:
+            started = [job["started"] for job in self._jobs.values() if job["status"] == "running"]
+            if not started or self._run_seconds is None:
+                return self.DEFAULT_RETRY_AFTER
+            return max(1.0, self._run_seconds - (time.time() - min(started)))
+    
+    def get(self, job_id):
+        with self._lock:
+            self._evict()
+            job = self._jobs.get(job_id)
+            return self._view(job) if job else None
+    
+    def cancel(self, job_id):
+        """Cancel a job: queued jobs never start, running ones stop before their next step"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            if job["status"] not in self.FINISHED:
+                job["_cancel"].set()
+                if job["_future"].cancel():
+                    self._finish(job, "cancelled")
+            return self._view(job)
+    
+    def list(self):
+        with self._lock:
+            self._evict()
+            return [{"id": job["id"], "status": job["status"], "created": job["created"]} for job in self._jobs.values()]
+    
+    @staticmethod
+    def _view(job):
+        view = {k: v for k, v in job.items() if not k.startswith('_')}
+        view["progress"] = dict(job["progress"])
+        return view
+    
+    def snapshot(self):
+        with self._lock:
+            statuses = [job["status"] for job in self._jobs.values()]
+            return {**self.stats, "queued": statuses.count("queued"), "running": statuses.count("running"),
+                    "retained": len(statuses), "max_jobs": self.max_jobs}
+
 # Global ReAct agent instance
 react_agent = AdvancedReActAgent()
+admission_controller = AdmissionController()
+job_manager = JobManager(react_agent)
+# Set by start_server when SMARTITECTURE_CAPTURE is configured
+traffic_recorder = None
+
+def agent_state_payload():
+    """Body of GET /agent/state (also pushed over the session channel)"""
+    return {
+        "state": "ready", 
+        "framework": "ReAct",
+        "available_tools": list(react_agent.tools.keys()),
+        "memory_items": len(react_agent.memory),
+        "recent_memory": react_agent.memory[-3:],
+        "last_scratchpad_size": len(react_agent.scratchpad)
+    }
+
+def run_response_payload(agent_response, agent=None):
+    """Body of a completed /agent/run (from the global agent unless another one ran it)"""
+    agent = agent or react_agent
+    return {
+        "result": agent_response["result"],
+        "state": agent_response["state"],
+        "iterations": agent_response["iterations"],
+        "framework": "ReAct",
+        "scratchpad": agent_response["scratchpad"],
+        "tools_used": agent_response["tools_used"],
+        "planner": agent_response["planner"],
+        "conversation": agent_response["conversation"],
+        "available_tools": list(agent.tools.keys()),
+        "memory_items": len(agent.memory)
+    }
+
+def charged_tool(input_text, use_planner):
+    """The tool a run is charged for against the client's rate limit: the one the router would pick"""
+    thought, confident = react_agent.route_request(input_text)
+    return react_agent.parse_action(thought)[0] if confident or not use_planner else 'ai_analysis'
+
+def admit_agent_run(client_id, input_text, use_planner, take_slot=True):
+    """Apply admission control to one agent run
+    
+    Returns None once admitted - holding a worker slot the caller must release, unless
+    take_slot is False (background jobs are bounded by the job executor instead) -
+    otherwise (status, message, retry_after) describing the rejection.
+    """
+    tool_name = charged_tool(input_text, use_planner)
+    retry_after = admission_controller.check_rate(client_id, tool_name)
+    if retry_after:
+        return 429, "Rate limit exceeded", retry_after
+    if take_slot and not admission_controller.acquire():
+        # Shed requests never ran: don't let them count against the client's rate limit
+        admission_controller.refund(client_id, tool_name)
+        return 503, "Server busy: request queue is full", admission_controller.retry_after()
+    return None
+
+class WebSocketConnection:
+    """Minimal RFC 6455 server side: text messages, ping/pong and close over the handler's streams"""
+    
+    GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+    MAX_MESSAGE_BYTES = 1024 * 1024
+    
+    def __init__(self, rfile, wfile, sock=None):
+        self.rfile = rfile
+        self.wfile = wfile
+        self.sock = sock
+        self.closed = False
+        self._send_lock = threading.Lock()
+    
+    @classmethod
+    def accept_key(cls, key):
+        return base64.b64encode(hashlib.sha1((key + cls.GUID).encode()).digest()).decode()
+    
+    def _read_exact(self, count):
+        data = self.rfile.read(count)
+        if len(data) < count:
+            raise ConnectionError("WebSocket connection closed")
+        return data
+    
+    @staticmethod
+    def _unmask(payload, mask):
+        if not payload:
+            return payload
+        key = (mask * (len(payload) // 4 + 1))[:len(payload)]
+        return (int.from_bytes(payload, 'little') ^ int.from_bytes(key, 'little')).to_bytes(len(payload), 'little')
+    
+    def receive(self):
+        """Next text message from the client, or None once the connection is closing"""
+        fragments = []
+        size = 0
+        while True:
+            first, second = self._read_exact(2)
+            opcode = first & 0x0F
+            length = second & 0x7F
+            if length == 126:
+                length = int.from_bytes(self._read_exact(2), 'big')
+            elif length == 127:
+                length = int.from_bytes(self._read_exact(8), 'big')
+            if not second & 0x80:
+                self.close(1002)  # clients must mask their frames
+                return None
+            mask = self._read_exact(4)
+            size += length
+            if size > self.MAX_MESSAGE_BYTES:
+                self.close(1009)
+                return None
+            payload = self._unmask(self._read_exact(length), mask)
+            
+            if opcode == 0x8:
+                self.close()
+                return None
+            if opcode == 0x9:
+                self._send_frame(0xA, payload)
+                continue
+            if opcode == 0xA:
+                continue
+            fragments.append(payload)
+            if first & 0x80:
+                return b''.join(fragments).decode('utf-8')
+    
+    def send(self, text):
+        self._send_frame(0x1, text.encode('utf-8'))
+    
+    def _send_frame(self, opcode, payload):
+        length = len(payload)
+        if length < 126:
+            header = bytes([0x80 | opcode, length])
+        elif length < 65536:
+            header = bytes([0x80 | opcode, 126]) + length.to_bytes(2, 'big')
+        else:
+            header = bytes([0x80 | opcode, 127]) + length.to_bytes(8, 'big')
+        with self._send_lock:
+            if self.closed:
+                raise ConnectionError("WebSocket connection closed")
+            self.wfile.write(header + payload)
+    
+    def close(self, code=1000):
+        if self.closed:
+            return
+        try:
+            self._send_frame(0x8, code.to_bytes(2, 'big'))
+        except OSError:
+            pass
+        self.closed = True
+    
+    def abort(self):
+        """Drop the connection without a closing handshake, unblocking any reader or writer"""
+        self.closed = True
+        if self.sock:
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+class AgentChannel:
+    """One long-lived client session over a WebSocket
+    
+    Client messages are JSON objects tagged with an id:
+      {"type": "run", "id": "r1", "input": "...", "max_iterations": 3, "planner": "llm", "session_id": "..."}
+      {"type": "cancel", "id": "r1"}   {"type": "state", "id": "s1"}   {"type": "ping", "id": "p1"}
+    Runs execute concurrently; the server pushes "step" events while they work, then a
+    "result" (or "rejected"/"error") with the same id, plus "state_changed" whenever the
+    agent's memory or workflows change.
+    
+    Outgoing messages are queued and written by a sender thread, so a client that stops
+    reading never blocks the agent; once max_outbox messages are waiting it is dropped.
+    """
+    
+    def __init__(self, ws, client_id, max_parallel=4, max_outbox=256):
+        self.ws = ws
+        self.client_id = client_id
+        self._executor = ThreadPoolExecutor(max_workers=max_parallel)
+        self._outbox = queue.Queue(maxsize=max_outbox)
+        self._sender = threading.Thread(target=self._drain_outbox, daemon=True)
+        self._inflight = {}
+        self._lock = threading.Lock()
+        # Runs without their own session_id share one conversation per connection
+        self.session_id = f"ws-{base64.urlsafe_b64encode(os.urandom(6)).decode()}"
+    
+    def serve(self):
+        self._sender.start()
+        react_agent.state_listeners.append(self._on_state_change)
+        try:
+            while True:
+                try:
+                    message = self.ws.receive()
+                except (ConnectionError, OSError, UnicodeDecodeError):
+                    break
+                if message is None:
+                    break
+                self._dispatch(message)
+        finally:
+            react_agent.state_listeners.remove(self._on_state_change)
+            # Nobody is left to read the results: stop in-flight work early
+            with self._lock:
+                for cancel_event in self._inflight.values():
+                    cancel_event.set()
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._send(None)
+            self.ws.close()
+    
+    def _dispatch(self, message):
+        try:
+            request = json.loads(message)
+            kind = request.get('type')
+            request_id = request.get('id')
+        except (ValueError, AttributeError):
+            self._send({"type": "error", "id": None, "error": "Messages must be JSON objects"})
+            return
+        
+        if kind == 'run':
+            with self._lock:
+                if request_id is None or request_id in self._inflight:
+                    self._send({"type": "error", "id": request_id, "error": "Run messages need an id that is not in flight"})
+                    return
+                cancel_event = self._inflight[request_id] = threading.Event()
+            self._executor.submit(self._run, request_id, request, cancel_event)
+        elif kind == 'cancel':
+            with self._lock:
+                cancel_event = self._inflight.get(request_id)
+            if cancel_event:
+                cancel_event.set()
+                self._send({"type": "cancelling", "id": request_id})
+            else:
+                self._send({"type": "error", "id": request_id, "error": "No request in flight with that id"})
+        elif kind == 'state':
+            self._send({"type": "state", "id": request_id, **agent_state_payload()})
+        elif kind == 'ping':
+            self._send({"type": "pong", "id": request_id})
+        else:
+            self._send({"type": "error", "id": request_id, "error": f"Unknown message type '{kind}'"})
+    
+    def _run(self, request_id, request, cancel_event):
+        try:
+            input_text = request.get('input', 'No input provided')
+            use_planner = request.get('planner') == 'llm'
+            rejection = admit_agent_run(self.client_id, input_text, use_planner)
+            if rejection:
+                status, message, retry_after = rejection
+                self._send({"type": "rejected", "id": request_id, "status": status,
+                            "error": message, "retry_after": max(1, math.ceil(retry_after))})
+                return
+            try:
+                agent_response = react_agent.process_request(
+                    input_text, request.get('max_iterations', 3), use_planner,
+                    on_step=lambda step: self._send({"type": "step", "id": request_id, "step": step}),
+                    cancel_event=cancel_event,
+                    session_id=request.get('session_id', self.session_id)
+                )
+            finally:
+                admission_controller.release()
+            self._send({"type": "result", "id": request_id, **run_response_payload(agent_response)})
+        except Exception as e:
+            self._send({"type": "error", "id": request_id, "error": str(e)})
+        finally:
+            with self._lock:
+                self._inflight.pop(request_id, None)
+    
+    def _on_state_change(self, op, data):
+        self._send({"type": "state_changed", "op": op, "data": data,
+                    "memory_items": len(react_agent.memory), "workflows": len(react_agent.workflows)})
+    
+    def _send(self, payload):
+        """Queue a message for the sender thread (None stops it); never blocks the caller"""
+        try:
+            self._outbox.put_nowait(None if payload is None else json.dumps(payload))
+        except queue.Full:
+            # The client stopped reading: drop it rather than let its backlog grow
+            self.ws.abort()
+    
+    def _drain_outbox(self):
+        while True:
+            message = self._outbox.get()
+            if message is None:
+                return
+            try:
+                self.ws.send(message)
+            except (ConnectionError, OSError):
+                # The client went away; stopping the reader makes serve() clean up
+                self.ws.abort()
+                return
 
 class SmartitectureHandler(http.server.BaseHTTPRequestHandler):
+    def setup(self):
+        super().setup()
+        self.wfile = _CountingWriter(self.wfile)
+    
+    def send_response(self, code, message=None):
+        self._status = code
+        super().send_response(code, message)
+    
+    def handle_one_request(self):
+        """Handle a request, recording it when traffic capture is on"""
+        self._status = None
+        self._request_body = b''
+        self.wfile.bytes_written = 0
+        started_at = time.time()
+        started = time.perf_counter()
+        super().handle_one_request()
+        # Malformed requests are answered by send_error before a path or headers exist;
+        # WebSocket sessions (101) can't be replayed as plain requests
+        if (traffic_recorder and self._status not in (None, 101) and getattr(self, 'headers', None)
+                and traffic_recorder.should_capture()):
+            traffic_recorder.record(
+                started_at, self.command, self.path, self.headers.get('X-Client-Id'),
+                self._request_body, self._status, self.wfile.bytes_written,
+                (time.perf_counter() - started) * 1000
+            )
+    
     def do_GET(self):
         parsed_path = urlparse(self.path)
         
@@ -713,7 +2377,11 @@ class SmartitectureHandler(http.server.BaseHTTPRequestHandler):
                 "status": "healthy", 
                 "service": "smartitecture-react-agent",
                 "agent_memory_items": len(react_agent.memory),
-                "available_tools": len(react_agent.tools)
+                "available_tools": len(react_agent.tools),
+                "admission": admission_controller.snapshot(),
+                "tool_cache": react_agent.tool_cache.snapshot(),
+                "journal": react_agent.journal.snapshot() if react_agent.journal else None,
+                "jobs": job_manager.snapshot()
             }
             self.wfile.write(json.dumps(response).encode())
             
@@ -722,16 +2390,22 @@ class SmartitectureHandler(http.server.BaseHTTPRequestHandler):
             self.send_header('Content-type', 'application/json')
             self.send_header('Access-Control-Allow-Origin', '*')
             self.end_headers()
-            response = {
-                "state": "ready", 
-                "framework": "ReAct",
-                "available_tools": list(react_agent.tools.keys()),
-                "memory_items": len(react_agent.memory),
-                "recent_memory": [item['info'] for item in react_agent.memory[-3:]] if react_agent.memory else [],
-                "last_scratchpad_size": len(react_agent.scratchpad)
-            }
+            response = agent_state_payload()
             self.wfile.write(json.dumps(response).encode())
             
+        elif parsed_path.path == '/agent/ws':
+            self._serve_websocket()
+            
+        elif parsed_path.path == '/agent/backends':
+            self._send_json(200, react_agent.llm_pool.snapshot())
+            
+        elif parsed_path.path == '/agent/jobs':
+            self._send_json(200, {"jobs": job_manager.list()})
+            
+        elif parsed_path.path.startswith('/agent/jobs/'):
+            job = job_manager.get(parsed_path.path[len('/agent/jobs/'):])
+            self._send_json(200 if job else 404, job or {"error": "Job not found or expired"})
+            
         else:
             self.send_response(404)
             self.send_header('Content-type', 'application/json')
@@ -744,14 +2418,40 @@ class SmartitectureHandler(http.server.BaseHTTPRequestHandler):
         if self.path == '/agent/run':
             content_length = int(self.headers['Content-Length'])
             post_data = self.rfile.read(content_length)
+            self._request_body = post_data
             
             try:
                 request_data = json.loads(post_data.decode())
                 input_text = request_data.get('input', 'No input provided')
                 max_iterations = request_data.get('max_iterations', 3)
+                use_planner = request_data.get('planner') == 'llm'
+                session_id = request_data.get('session_id')
+                
+                client_id = self.headers.get('X-Client-Id') or self.client_address[0]
+                run_async = bool(request_data.get('async'))
+                rejection = admit_agent_run(client_id, input_text, use_planner, take_slot=not run_async)
+                if rejection:
+                    self._send_rejection(*rejection)
+                    return
+                
+                if run_async:
+                    # Answer right away; the client polls /agent/jobs/{id} for progress and result
+                    job = job_manager.submit(input_text, max_iterations, use_planner, session_id)
+                    if job is None:
+                        admission_controller.refund(client_id, charged_tool(input_text, use_planner))
+                        self._send_rejection(503, "Server busy: job table is full", job_manager.retry_after())
+                        return
+                    status_url = f"/agent/jobs/{job['id']}"
+                    self._send_json(202, {"job_id": job["id"], "status": job["status"], "status_url": status_url,
+                                          "framework": "ReAct"}, headers={'Location': status_url})
+                    return
                 
                 # Process request using ReAct agent
-                agent_response = react_agent.process_request(input_text, max_iterations)
+                try:
+                    agent_response = react_agent.process_request(input_text, max_iterations, use_planner,
+                                                                 session_id=session_id)
+                finally:
+                    admission_controller.release()
                 
                 self.send_response(200)
                 self.send_header('Content-type', 'application/json')
@@ -759,16 +2459,7 @@ class SmartitectureHandler(http.server.BaseHTTPRequestHandler):
                 self.end_headers()
                 
                 # Return comprehensive ReAct response
-                response = {
-                    "result": agent_response["result"],
-                    "state": agent_response["state"],
-                    "iterations": agent_response["iterations"],
-                    "framework": "ReAct",
-                    "scratchpad": agent_response["scratchpad"],
-                    "tools_used": agent_response["tools_used"],
-                    "available_tools": list(react_agent.tools.keys()),
-                    "memory_items": len(react_agent.memory)
-                }
+                response = run_response_payload(agent_response)
                 self.wfile.write(json.dumps(response).encode())
                 
             except Exception as e:
@@ -790,20 +2481,91 @@ class SmartitectureHandler(http.server.BaseHTTPRequestHandler):
             response = {"error": "Not found"}
             self.wfile.write(json.dumps(response).encode())
 
+    def do_DELETE(self):
+        parsed_path = urlparse(self.path)
+        if parsed_path.path.startswith('/agent/jobs/'):
+            job = job_manager.cancel(parsed_path.path[len('/agent/jobs/'):])
+            self._send_json(202 if job else 404, job or {"error": "Job not found or expired"})
+        else:
+            self._send_json(404, {"error": "Not found"})
+    
+    def _serve_websocket(self):
+        """Upgrade to a WebSocket and serve the session channel until the client leaves"""
+        key = self.headers.get('Sec-WebSocket-Key')
+        if self.headers.get('Upgrade', '').lower() != 'websocket' or not key:
+            self._send_json(400, {"error": "Expected a WebSocket upgrade request"})
+            return
+        if self.headers.get('Sec-WebSocket-Version') != '13':
+            self._send_json(426, {"error": "Unsupported WebSocket version"}, headers={'Sec-WebSocket-Version': '13'})
+            return
+        # The upgrade needs an HTTP/1.1 status line; other responses keep the server default
+        self.protocol_version = 'HTTP/1.1'
+        self.send_response(101, 'Switching Protocols')
+        self.send_header('Upgrade', 'websocket')
+        self.send_header('Connection', 'Upgrade')
+        self.send_header('Sec-WebSocket-Accept', WebSocketConnection.accept_key(key))
+        self.end_headers()
+        
+        # Step and result frames go out back to back; don't let Nagle hold the second one
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        client_id = self.headers.get('X-Client-Id') or self.client_address[0]
+        AgentChannel(WebSocketConnection(self.rfile, self.wfile, self.connection), client_id).serve()
+        self.close_connection = True
+    
+    def _send_json(self, status, payload, headers=None):
+        """Send a JSON response with the standard headers"""
+        self.send_response(status)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(json.dumps(payload).encode())
+    
+    def _send_rejection(self, status, message, retry_after):
+        """Reject a request that failed admission control (429 throttled / 503 shed)"""
+        retry_after = max(1, math.ceil(retry_after))
+        self._send_json(status, {
+            "error": message,
+            "retry_after": retry_after,
+            "framework": "ReAct"
+        }, headers={'Retry-After': str(retry_after)})
+    
     def log_message(self, format, *args):
         # Suppress default logging
         return
 
-def start_server(port=8001):
+class ThreadedAgentServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """TCP server handling each connection on its own thread; agent work is bounded by admission control"""
+    daemon_threads = True
+    allow_reuse_address = True
+    # Bursts beyond the default backlog of 5 get their SYNs dropped and stall for a
+    # second; accept them and let admission control decide instead
+    request_queue_size = 128
+
+def start_server(port=8001, state_dir=None, capture_path=None):
     """Start the ReAct agent HTTP server"""
+    global traffic_recorder
+    # Traffic capture is opt-in: SMARTITECTURE_CAPTURE=<file> [SMARTITECTURE_CAPTURE_SAMPLE=0.1]
+    capture_path = capture_path or os.environ.get('SMARTITECTURE_CAPTURE')
+    if capture_path:
+        traffic_recorder = TrafficRecorder(capture_path, float(os.environ.get('SMARTITECTURE_CAPTURE_SAMPLE', '1.0')))
+    # Durable agent state: SMARTITECTURE_STATE_DIR / SMARTITECTURE_FSYNC override the defaults
+    state_dir = state_dir or os.environ.get('SMARTITECTURE_STATE_DIR') or Path.home() / '.smartitecture' / 'agent_state'
+    journal = StateJournal(state_dir, fsync=os.environ.get('SMARTITECTURE_FSYNC', 'interval'))
+    recovery = react_agent.attach_journal(journal)
     try:
-        with socketserver.TCPServer(("127.0.0.1", port), SmartitectureHandler) as httpd:
+        with ThreadedAgentServer(("127.0.0.1", port), SmartitectureHandler) as httpd:
             print(f"🤖 Smartitecture ReAct Agent API running on http://127.0.0.1:{port}")
             print("\n📋 Available endpoints:")
             print("- GET  /           - API info and available tools")
             print("- GET  /health     - Health check and agent status") 
             print("- GET  /agent/state - Agent state and memory info")
-            print("- POST /agent/run  - Run ReAct agent with user input")
+            print("- GET  /agent/ws    - WebSocket session channel (multiplexed runs, step/state pushes, cancel)")
+            print("- GET  /agent/backends - Latency and health of each local LLM backend")
+            print("- POST /agent/run  - Run ReAct agent with user input (\"async\": true returns a job id)")
+            print("- GET  /agent/jobs/{id} - Status, progress and result of an async job")
+            print("- DELETE /agent/jobs/{id} - Cancel an async job")
             print("\n🛠️  Available ReAct Tools:")
             for tool_name, tool_func in react_agent.tools.items():
                 print(f"- {tool_name}: {tool_func.__doc__ or 'No description'}")
@@ -812,12 +2574,20 @@ def start_server(port=8001):
             print("- Tool calling and execution")
             print("- Memory storage and retrieval")
             print("- Structured reasoning process")
+            print(f"- Durable memory in {state_dir} ({len(react_agent.memory)} items, {recovery['replayed_records']} log records replayed in {recovery['recovery_ms']}ms)")
+            if traffic_recorder:
+                print(f"- Capturing {traffic_recorder.sample_rate:.0%} of traffic to {traffic_recorder.path}")
+            print(f"- Admission control: {admission_controller.max_concurrent} workers, queue of {admission_controller.max_queue}, per-client rate limits")
             print("\nPress Ctrl+C to stop")
             httpd.serve_forever()
     except KeyboardInterrupt:
         print("\nShutting down server...")
     except Exception as e:
         print(f"Server error: {e}")
+    finally:
+        journal.close()
+        if traffic_recorder:
+            traffic_recorder.close()
 
 if __name__ == "__main__":
     start_server()
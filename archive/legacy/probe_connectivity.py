@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Run the agent's connectivity prober from the command line
+Probes each target with DNS resolution, a TCP connect and (for web ports) an HTTP
+HEAD request, the same way the network_tools tool does.
+
+Run this to probe hosts:  python probe_connectivity.py google.com 1.1.1.1:53 --count 4
+Run this to check the prober against loopback listeners:  python probe_connectivity.py --check
+"""
+
+import argparse
+import asyncio
+import http.server
+import socket
+import socketserver
+import sys
+import threading
+
+from minimal_server import ConnectivityProber
+
+
+class QuietHandler(http.server.BaseHTTPRequestHandler):
+    def do_HEAD(self):
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        return
+
+
+def check_prober():
+    """Probe an HTTP listener, a bare TCP listener, a closed port and an unresolvable host"""
+    http_server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), QuietHandler)
+    http_server.daemon_threads = True
+    threading.Thread(target=http_server.serve_forever, daemon=True).start()
+    http_port = http_server.server_address[1]
+
+    # Accepts connections and never speaks, like a database or SSH port
+    tcp_listener = socket.socket()
+    tcp_listener.bind(("127.0.0.1", 0))
+    tcp_listener.listen(16)
+    tcp_port = tcp_listener.getsockname()[1]
+
+    # Bind and release a port so nothing is listening on it
+    with socket.socket() as closed:
+        closed.bind(("127.0.0.1", 0))
+        closed_port = closed.getsockname()[1]
+
+    prober = ConnectivityProber(timeout=2.0)
+    # The loopback HTTP listener is on an ephemeral port: treat it as a web port
+    prober.HTTP_PORTS = ConnectivityProber.HTTP_PORTS | {http_port}
+    targets = [("127.0.0.1", http_port), ("127.0.0.1", tcp_port), ("127.0.0.1", closed_port),
+               ("smartitecture-check.invalid", 443)]
+    count = 3
+
+    print("🧪 Connectivity prober against loopback listeners")
+    print("=" * 40)
+    results = asyncio.run(prober.probe(targets, count))
+    print(prober.format_report([(t, results[t]) for t in targets], count))
+    http_result, tcp_result, closed_result, dns_result = (results[t] for t in targets)
+
+    ok = (
+        http_result["ok"] == count and http_result["http_status"] == 204
+        and set(http_result["latency_ms"]) == {"dns", "tcp", "http"}
+        and tcp_result["ok"] == count and "http" not in tcp_result["latency_ms"]
+        and closed_result["failed"] == count and closed_result["reason"] == "connection refused"
+        and dns_result["failed"] == count and dns_result["reason"] in ("DNS lookup failed", "timed out")
+    )
+
+    # Overlapping target lists reuse each other's probes from the prober's cache
+    prober.run(targets[:2], count)
+    ok = ok and prober.run(targets[1:2], count).endswith("(cached)")
+
+    http_server.shutdown()
+    http_server.server_close()
+    tcp_listener.close()
+    print("✅ Prober check passed" if ok else "❌ Prober check failed")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Probe connectivity to hosts")
+    parser.add_argument("targets", nargs="*", help="host, host:port or URL (default google.com)")
+    parser.add_argument("--count", type=int, default=4, help="probe rounds per target")
+    parser.add_argument("--timeout", type=float, default=3.0, help="seconds allowed per phase")
+    parser.add_argument("--check", action="store_true", help="run the loopback prober check and exit")
+    args = parser.parse_args()
+
+    if args.check:
+        sys.exit(0 if check_prober() else 1)
+
+    targets = ConnectivityProber.parse_targets(" ".join(args.targets)) or [("google.com", 443)]
+    print(ConnectivityProber(timeout=args.timeout).run(targets, args.count))
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Replay captured Smartitecture API traffic for performance regression testing
+Re-issues requests recorded by the server's capture mode (SMARTITECTURE_CAPTURE) at
+the original pace, N times faster, or as fast as possible, keeping the recorded
+inter-arrival times. Each run is saved so it can be diffed against a baseline run.
+
+Run this to record a baseline:    python replay_traffic.py capture.jsonl --output baseline.json
+Run this to compare against it:   python replay_traffic.py capture.jsonl --speed 2 --baseline baseline.json
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+def load_capture(path):
+    """Read a capture file and its rotated backups (path.N is oldest) in arrival order"""
+    files = []
+    index = 1
+    while os.path.exists(f"{path}.{index}"):
+        files.append(f"{path}.{index}")
+        index += 1
+    files = list(reversed(files)) + [path]
+
+    records = []
+    for name in files:
+        with open(name, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    records.append(json.loads(line))
+    records.sort(key=lambda r: r["ts"])
+    return records
+
+
+def shape(value):
+    """Structure of a JSON value (keys and types, not contents) for comparing responses"""
+    if isinstance(value, dict):
+        return {key: shape(value[key]) for key in sorted(value)}
+    if isinstance(value, list):
+        return [shape(value[0])] if value else []
+    return type(value).__name__
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))]
+
+
+def send(target, record):
+    """Issue one captured request; returns the measured result"""
+    headers = {"X-Client-Id": record["client_id"]} if record.get("client_id") else {}
+    started = time.perf_counter()
+    try:
+        response = requests.request(record["method"], target + record["path"], json=record.get("body"),
+                                    headers=headers, timeout=60)
+        latency_ms = (time.perf_counter() - started) * 1000
+        try:
+            response_shape = shape(response.json())
+        except ValueError:
+            response_shape = "non-json"
+        return {"status": response.status_code, "latency_ms": latency_ms,
+                "response_bytes": len(response.content), "shape": response_shape}
+    except requests.exceptions.RequestException as e:
+        return {"status": None, "latency_ms": (time.perf_counter() - started) * 1000,
+                "response_bytes": 0, "shape": None, "failure": type(e).__name__}
+
+
+def replay(records, target, speed, concurrency):
+    """Open-loop replay: requests go out on the recorded schedule, not when the previous one returns"""
+    results = [None] * len(records)
+    first_ts = records[0]["ts"] if records else 0
+    run_started = time.perf_counter()
+
+    def run(index, record, scheduled):
+        result = send(target, record)
+        result.update(index=index, path=record["path"], method=record["method"],
+                      schedule_lag_ms=round((time.perf_counter() - run_started - scheduled) * 1000 - result["latency_ms"], 3))
+        results[index] = result
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for index, record in enumerate(records):
+            scheduled = 0.0 if speed is None else (record["ts"] - first_ts) / speed
+            delay = scheduled - (time.perf_counter() - run_started)
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(run, index, record, scheduled)
+    return results, time.perf_counter() - run_started
+
+
+def summarize(results):
+    """Latency percentiles and status counts per endpoint"""
+    summary = {}
+    for result in results:
+        key = f"{result['method']} {result['path']}"
+        entry = summary.setdefault(key, {"count": 0, "statuses": {}, "latencies": []})
+        entry["count"] += 1
+        entry["statuses"][str(result["status"])] = entry["statuses"].get(str(result["status"]), 0) + 1
+        entry["latencies"].append(result["latency_ms"])
+    for entry in summary.values():
+        latencies = entry.pop("latencies")
+        entry.update({f"p{p}": round(percentile(latencies, p), 2) for p in (50, 90, 99)})
+    return summary
+
+
+def diff_runs(run, baseline, threshold):
+    """Print latency and response-shape differences; returns True when there is a regression"""
+    regressed = False
+    print("\n📊 Latency vs baseline:")
+    for key, entry in run["summary"].items():
+        base = baseline["summary"].get(key)
+        if not base:
+            print(f"• {key}: not in baseline")
+            continue
+        changes = []
+        for p in ("p50", "p90", "p99"):
+            change = (entry[p] - base[p]) / base[p] * 100 if base[p] else 0.0
+            flag = " ⚠️" if change > threshold else ""
+            regressed = regressed or bool(flag)
+            changes.append(f"{p} {base[p]:.1f} → {entry[p]:.1f}ms ({change:+.0f}%){flag}")
+        print(f"• {key}: " + ", ".join(changes))
+
+    print("\n🧩 Response shapes vs baseline:")
+    mismatches = {}
+    base_results = {r["index"]: r for r in baseline["results"]}
+    for result in run["results"]:
+        base = base_results.get(result["index"])
+        if base and (base["shape"] != result["shape"] or base["status"] != result["status"]):
+            mismatches.setdefault(f"{result['method']} {result['path']}", []).append((base, result))
+    if not mismatches:
+        print("• All responses match the baseline")
+    for key, pairs in mismatches.items():
+        base, result = pairs[0]
+        print(f"• {key}: {len(pairs)} differ, e.g. request #{result['index']} "
+              f"status {base['status']} → {result['status']}, shape {json.dumps(base['shape'])} → {json.dumps(result['shape'])}")
+    return regressed or bool(mismatches)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay captured Smartitecture traffic")
+    parser.add_argument("capture", help="capture file written by the server (rotated backups are included)")
+    parser.add_argument("--target", default="http://127.0.0.1:8001")
+    parser.add_argument("--speed", default="1", help="time scale: 1 = recorded pace, 4 = four times faster, max = no delays")
+    parser.add_argument("--concurrency", type=int, default=32, help="maximum requests in flight")
+    parser.add_argument("--limit", type=int, help="replay only the first N requests")
+    parser.add_argument("--output", help="save this run (results and summary) as JSON")
+    parser.add_argument("--baseline", help="a previous --output file to diff against")
+    parser.add_argument("--threshold", type=float, default=20.0, help="latency increase in percent that counts as a regression")
+    args = parser.parse_args()
+
+    records = load_capture(args.capture)[:args.limit]
+    speed = None if args.speed == "max" else float(args.speed)
+
+    print("🔁 Smartitecture Traffic Replay")
+    print("=" * 40)
+    print(f"• {len(records)} requests against {args.target} at {'max' if speed is None else f'{speed:g}x'} speed")
+
+    results, elapsed = replay(records, args.target, speed, args.concurrency)
+    run = {"target": args.target, "speed": args.speed, "elapsed_s": round(elapsed, 3),
+           "summary": summarize(results), "results": results}
+    print(f"• Finished in {elapsed:.2f}s ({len(records) / elapsed if elapsed else 0:.1f} req/s)")
+    for key, entry in run["summary"].items():
+        print(f"• {key}: {entry['count']} requests, p50 {entry['p50']}ms p90 {entry['p90']}ms p99 {entry['p99']}ms, statuses {entry['statuses']}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(run, f, indent=2)
+        print(f"• Saved run to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if diff_runs(run, baseline, args.threshold):
+            print("\n❌ Differences from baseline found")
+            sys.exit(1)
+        print("\n✅ No regressions against baseline")
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Deterministic stand-in for a local Ollama server
+Answers /api/tags and /api/generate the same way every time so the LLM planner can be
+exercised without a real model. Tokens are whitespace-separated words, and like Ollama
+the returned `context` lets the next call skip re-processing the earlier conversation.
+
+Run this to serve the stub:        python stub_ollama_server.py --port 11434 --delay 0.2
+Run this to check the planner, backend routing and a hung backend:  python stub_ollama_server.py --check
+"""
+
+import argparse
+import http.server
+import json
+import re
+import socketserver
+import sys
+import threading
+import time
+import zlib
+
+
+def tokenize(text):
+    """Stable fake token ids, one per word"""
+    return [zlib.crc32(word.encode()) % 32000 for word in text.split()]
+
+
+def plan_reply(prompt):
+    """The stub model: act on the request first, then answer with the observation"""
+    observation = re.search(r'Observation \d+:\s*(.*?)(?:\nNext step\?|$)', prompt, re.DOTALL)
+    if observation:
+        return f"Thought: I have what I need. Final Answer: {observation.group(1).strip()}"
+    request = re.search(r'User Request:\s*(.*)', prompt)
+    text = request.group(1).replace('(', '').replace(')', '') if request else prompt[:80]
+    return f"Thought: I should look at the text first. Action: text_analyzer({text})"
+
+
+class StubOllamaHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == '/api/tags':
+            self._send({"models": [{"name": self.server.model}]})
+        elif self.path == '/stub/stats':
+            self._send(self.server.stats)
+        else:
+            self._send({"error": "Not found"}, 404)
+
+    def do_POST(self):
+        if self.path != '/api/generate':
+            self._send({"error": "Not found"}, 404)
+            return
+        request = json.loads(self.rfile.read(int(self.headers['Content-Length'])).decode())
+        time.sleep(self.server.delay)
+        with self.server.lock:
+            failing = self.server.replies_left is not None and self.server.replies_left <= 0
+            if self.server.replies_left is not None:
+                self.server.replies_left -= 1
+        if failing:
+            # Simulates the model crashing or being unloaded mid-conversation
+            self._send({"error": "model unavailable"}, 503)
+            return
+
+        prompt_tokens = tokenize(request.get('prompt', ''))
+        reply = plan_reply(request.get('prompt', ''))
+        reply_tokens = tokenize(reply)
+        # Only the new prompt is evaluated; earlier turns arrive pre-processed in `context`
+        context = list(request.get('context') or []) + prompt_tokens + reply_tokens
+
+        with self.server.lock:
+            self.server.stats["generate_calls"] += 1
+            self.server.stats["prompt_tokens"] += len(prompt_tokens)
+        self._send({
+            "model": request.get('model', self.server.model),
+            "response": reply,
+            "done": True,
+            "context": context,
+            "prompt_eval_count": len(prompt_tokens),
+            "eval_count": len(reply_tokens)
+        })
+
+    def _send(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        return
+
+
+class StubOllamaServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port=0, model="llama3.1", delay=0.0):
+        super().__init__(("127.0.0.1", port), StubOllamaHandler)
+        self.model = model
+        self.delay = delay
+        # Number of generate calls to answer before failing the rest (None: never fail)
+        self.replies_left = None
+        self.lock = threading.Lock()
+        self.stats = {"generate_calls": 0, "prompt_tokens": 0}
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+def start_stub(port=0, model="llama3.1", delay=0.0):
+    """Start a stub server on a background thread and return it"""
+    server = StubOllamaServer(port, model, delay)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def check_planner():
+    """Run the agent's LLM planner against the stub and verify context reuse"""
+    from minimal_server import AdvancedReActAgent
+
+    stub = start_stub()
+    agent = AdvancedReActAgent()
+    agent.configure_llm_backends([(stub.url, "llama3.1")])
+
+    print("🧪 Planner against stub model")
+    print("=" * 40)
+    response = agent.process_request("hello there smartitecture", use_planner=True)
+    planner = response["planner"]
+    print(json.dumps(planner, indent=2))
+    steps = planner["steps"]
+    ok = (
+        planner["mode"] == "llm"
+        and len(steps) == 2
+        and steps[1]["prompt_tokens"] < steps[0]["prompt_tokens"]
+        and steps[1]["context_tokens"] > steps[0]["context_tokens"]
+        and "Text analysis" in response["result"]
+    )
+
+    # A request the keyword router is confident about never reaches the model
+    calls_before = stub.stats["generate_calls"]
+    fast = agent.process_request("2 + 2", use_planner=True)
+    ok = ok and fast["planner"]["mode"] == "keyword" and stub.stats["generate_calls"] == calls_before
+
+    # The model fails after its first step: the answer comes from that step's observation,
+    # not from the keyword fallback treating its own error text as an action
+    stub.replies_left = 1
+    broken = agent.process_request("hello again smartitecture", use_planner=True)
+    answer = broken["result"].split("Final Answer:", 1)[1].strip()
+    print(f"• Model failed after step 1, answered with: {answer.splitlines()[0]}")
+    ok = (ok and broken["planner"]["error"] is not None and len(broken["planner"]["steps"]) == 1
+          and answer.startswith("Text analysis") and "Unknown tool" not in broken["result"])
+
+    stub.shutdown()
+    print("✅ Planner check passed" if ok else "❌ Planner check failed")
+    return ok
+
+
+def check_backend_routing():
+    """Route across a fast and a slow stub, then slow the fast one down and watch hedging"""
+    from minimal_server import LLMBackendPool
+
+    fast = start_stub(model="fast-model", delay=0.02)
+    slow = start_stub(model="slow-model", delay=0.15)
+    pool = LLMBackendPool([(fast.url, "fast-model"), (slow.url, "slow-model")], min_samples=5)
+    payload = {"prompt": "User Request: hello", "stream": False}
+
+    print("\n🧪 Backend routing against stub models")
+    print("=" * 40)
+    for _ in range(10):
+        pool.generate(payload)
+    routed_fast = pool.generate(payload)[1]["model"] == "fast-model"
+    print(f"• Warm pool routes to: {'fast-model' if routed_fast else 'slow-model'}")
+
+    # The fast backend stalls for longer than the calls keep coming: the first call is
+    # answered by its hedge, and the later ones route around the stall while it lasts
+    fast.delay = 5.0
+    latencies = []
+    winners = []
+    for _ in range(10):
+        started = time.perf_counter()
+        winners.append(pool.generate(payload)[1]["model"])
+        latencies.append((time.perf_counter() - started) * 1000)
+    stalled_calls = pool.backends[0]["inflight"]
+    print(f"• Stalled primary (5000ms): first call answered by {winners[0]} in {latencies[0]:.0f}ms, "
+          f"slowest of 10 calls {max(latencies):.0f}ms, {len(stalled_calls)} call(s) stuck on fast-model")
+    rerouted = all(model == "slow-model" for model in winners[1:])
+    print(f"• During the stall, routes to: {'slow-model' if rerouted else 'fast-model'}")
+
+    # A dead backend is skipped by failing over
+    fast.shutdown()
+    fast.server_close()
+    _, survivor = pool.generate(payload, prefer=pool.backends[0])
+    print(json.dumps(pool.snapshot(), indent=2))
+
+    ok = (routed_fast and winners[0] == "slow-model" and latencies[0] < 600 and max(latencies) < 600
+          and rerouted and len(stalled_calls) == 1 and survivor["model"] == "slow-model"
+          and pool.stats["hedge_wins"] == 1 and pool.stats["failovers"] == 1)
+    slow.shutdown()
+    print("✅ Backend routing check passed" if ok else "❌ Backend routing check failed")
+    return ok
+
+
+def check_hung_backend():
+    """A single backend that stops answering: analysis gives up quickly, and calls beyond
+    max_inflight fail at once instead of piling up threads"""
+    from concurrent.futures import ThreadPoolExecutor
+    from minimal_server import AdvancedReActAgent, LLMBackendError, LLMBackendPool
+
+    hung = start_stub(delay=3.0)
+    print("\n🧪 Hung single backend")
+    print("=" * 40)
+
+    agent = AdvancedReActAgent()
+    agent.configure_llm_backends([(hung.url, "llama3.1")])
+    agent.ANALYSIS_TIMEOUT = 0.5
+    started = time.perf_counter()
+    analysis = agent.ai_analysis_tool("why is my laptop slow")
+    analysis_ms = (time.perf_counter() - started) * 1000
+    print(f"• ai_analysis fell back in {analysis_ms:.0f}ms (model hangs for 3000ms)")
+
+    pool = LLMBackendPool([(hung.url, "llama3.1")], max_inflight=2)
+    payload = {"prompt": "User Request: hello", "stream": False}
+
+    def call(_):
+        started = time.perf_counter()
+        try:
+            pool.generate(payload, timeout=0.5)
+            outcome = "answered"
+        except LLMBackendError as e:
+            outcome = "busy" if "in flight" in str(e) else "timed out"
+        return outcome, (time.perf_counter() - started) * 1000
+
+    with ThreadPoolExecutor(max_workers=6) as callers:
+        outcomes = list(callers.map(call, range(6)))
+    busy = [ms for outcome, ms in outcomes if outcome == "busy"]
+    in_flight = len(pool.backends[0]["inflight"])
+    print(f"• 6 concurrent calls: {len(busy)} refused as busy (slowest refusal {max(busy or [0]):.0f}ms), "
+          f"{in_flight} call(s) in flight")
+
+    ok = (analysis.startswith("🔮 Basic AI Analysis") and analysis_ms < 1500
+          and len(busy) == 4 and max(busy) < 100 and in_flight <= 2 and pool.stats["busy"] == 4)
+    hung.shutdown()
+    print("✅ Hung backend check passed" if ok else "❌ Hung backend check failed")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Deterministic Ollama stub server")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--model", default="llama3.1")
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds to wait before each generate reply")
+    parser.add_argument("--check", action="store_true", help="run the planner, backend routing and hung backend checks and exit")
+    args = parser.parse_args()
+
+    if args.check:
+        sys.exit(0 if check_planner() and check_backend_routing() and check_hung_backend() else 1)
+
+    server = StubOllamaServer(args.port, args.model, args.delay)
+    print(f"🧪 Stub Ollama ({args.model}) running on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down stub...")